@@ -37,6 +37,86 @@ args_parser.parser.add_argument("--enable-auto-describe-image", action='store_tr
 args_parser.parser.add_argument("--always-download-new-model", action='store_true',
                                 help="Always download newer models", default=False)
 
+args_parser.parser.add_argument("--batch-sampling-size", type=int, default=1, metavar="BATCH_SIZE",
+                                help="Sample up to BATCH_SIZE text-to-image images of a task in one UNet batch. "
+                                     "Needs more VRAM, seeds stay reproducible. Ancestral and other samplers that "
+                                     "draw noise from the global generator are sampled one image at a time.")
+
+args_parser.parser.add_argument("--clip-cache-memory-size", type=int, default=256, metavar="MB",
+                                help="Size of the in-memory cache for CLIP text conditionings.")
+
+args_parser.parser.add_argument("--clip-cache-disk-size", type=int, default=2048, metavar="MB",
+                                help="Size of the on-disk cache for CLIP text conditionings, 0 disables it.")
+
+args_parser.parser.add_argument("--model-pool-size", type=int, default=1, metavar="NUM_MODELS",
+                                help="Number of base and refiner models kept in system RAM, switching back to one of them "
+                                     "does not reload the checkpoint.")
+
+args_parser.parser.add_argument("--lora-cache-size", type=int, default=1024, metavar="MB",
+                                help="Size of the in-memory cache for loaded LoRA patches, 0 disables it.")
+
+args_parser.parser.add_argument("--incremental-weight-patching", action='store_true',
+                                help="Keep LoRA patched weights when a model is unloaded and only recompute the weights "
+                                     "whose LoRAs changed when it is loaded again.")
+
+args_parser.parser.add_argument("--image-cache-memory-size", type=int, default=512, metavar="MB",
+                                help="Size of the in-memory cache for upscaled images and VAE encoded latents.")
+
+args_parser.parser.add_argument("--image-cache-disk-size", type=int, default=0, metavar="MB",
+                                help="Size of the on-disk cache for upscaled images and VAE encoded latents, "
+                                     "0 disables it.")
+
+args_parser.parser.add_argument("--sharpness-filter-chunk-rows", type=int, default=13, metavar="ROWS",
+                                help="Process the 13x13 kernel of the sharpness filter in chunks of ROWS kernel rows "
+                                     "to reduce its peak memory, 1 uses the least. The default of 13 keeps the original "
+                                     "filter.")
+
+args_parser.parser.add_argument("--preview-interval", type=int, default=1, metavar="STEPS",
+                                help="Render a sampling preview at most every STEPS steps.")
+
+args_parser.parser.add_argument("--preview-max-fps", type=float, default=0, metavar="FPS",
+                                help="Render at most FPS sampling previews per second, 0 means no limit.")
+
+args_parser.parser.add_argument("--disable-async-preview", action='store_true',
+                                help="Render sampling previews in the sampling loop instead of on a separate thread.")
+
+args_parser.parser.add_argument("--expansion-cache-size", type=int, default=4096, metavar="ITEMS",
+                                help="Number of Fooocus V2 prompt expansions kept in memory, 0 disables the cache.")
+
+args_parser.parser.add_argument("--expansion-cache-file", action='store_true',
+                                help="Persist Fooocus V2 prompt expansions in the cache folder.")
+
+args_parser.parser.add_argument("--expansion-batch-size", type=int, default=1, metavar="BATCH_SIZE",
+                                help="Generate up to BATCH_SIZE Fooocus V2 prompt expansions in one padded batch.")
+
+args_parser.parser.add_argument("--image-save-workers", type=int, default=2, metavar="NUM_THREADS",
+                                help="Encode and log output images in background threads, 0 saves them synchronously.")
+
+args_parser.parser.add_argument("--enhance-mask-batching", action='store_true',
+                                help="Detect the masks of all enhance tabs using SAM in one pass on the image before it is "
+                                     "inpainted by the first tab.")
+
+args_parser.parser.add_argument("--verbose-prompt-plan", action='store_true',
+                                help="Print the seed and final prompts of every image and each wildcard and array "
+                                     "replacement instead of only a summary of the prompt plan.")
+
+args_parser.parser.add_argument("--upscale-cpu-workers", type=int, default=1, metavar="NUM_THREADS",
+                                help="Upscale tiles in NUM_THREADS parallel threads when running on CPU.")
+
+args_parser.parser.add_argument("--upscale-cpu-bf16", action='store_true',
+                                help="Upscale in bfloat16 when running on CPU.")
+
+args_parser.parser.add_argument("--upscale-cpu-channels-last", action='store_true',
+                                help="Upscale in channels last memory format when running on CPU.")
+
+args_parser.parser.add_argument("--scheduler-max-skips", type=int, default=0, metavar="NUM_TASKS",
+                                help="Start queued tasks using the loaded models and LoRAs first, a task is passed over "
+                                     "at most NUM_TASKS times. 0, the default, keeps the submission order.")
+
+args_parser.parser.add_argument("--background-hash-workers", type=int, default=1, metavar="NUM_THREADS",
+                                help="Hash models and LoRAs missing from the hash cache in background threads at startup, "
+                                     "0 hashes them on first use.")
+
 args_parser.parser.add_argument("--rebuild-hash-cache", help="Generates missing model and LoRA hashes.",
                                 type=int, nargs="?", metavar="CPU_NUM_THREADS", const=-1)
 
@@ -7,32 +7,58 @@ Automatically processes prompts from TXT files in batches of 32.
 import os
 import sys
 import time
-import json
 import argparse
 from pathlib import Path
-from typing import List, Dict, Any
+from typing import List
 
 # Add Fooocus modules to path
-sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+root = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, root)
 
-import modules.config as config
-import modules.async_worker as worker
-import modules.flags as flags
+config = None
+engine = None
+
+
+def initialize_fooocus(fooocus_argv: List[str]):
+    """
+    Initialize Fooocus without the web UI. args_manager parses sys.argv on import,
+    so only the arguments meant for Fooocus may be left there.
+    """
+    global config, engine
+
+    sys.argv = [sys.argv[0]] + fooocus_argv
+    os.chdir(root)
+
+    import modules.config
+    from modules.hash_cache import init_cache
+
+    config = modules.config
+    os.environ["U2NET_HOME"] = config.path_inpaint
+
+    config.update_files()
+    init_cache(config.model_filenames, config.paths_checkpoints, config.lora_filenames, config.paths_loras)
+
+    import modules.batch_engine
+    engine = modules.batch_engine
 
 
 class BatchProcessor:
-    def __init__(self, prompts_dir: str = "prompts", output_dir: str = None, batch_size: int = 32):
+    def __init__(self, prompts_dir: str = "prompts", batch_size: int = 32, seed: int = None,
+                 task_per_prompt: bool = False):
         """
         Initialize the batch processor.
         
         Args:
             prompts_dir: Directory containing TXT files with prompts
-            output_dir: Directory to save generated images (uses Fooocus default if None)
-            batch_size: Number of images to generate per batch (max 32 for stability)
+            batch_size: Number of prompts queued at once (max 32 for stability)
+            seed: Base seed, prompt i of a file uses seed + i (random seeds if None)
+            task_per_prompt: Queue one task per prompt instead of one task per batch
         """
         self.prompts_dir = Path(prompts_dir)
-        self.output_dir = Path(output_dir) if output_dir else Path(config.path_outputs)
+        self.output_dir = Path(config.path_outputs)
         self.batch_size = min(batch_size, 32)  # Enforce max 32 for stability
+        self.seed = seed
+        self.task_per_prompt = task_per_prompt
         
         # Create prompts directory if it doesn't exist
         self.prompts_dir.mkdir(exist_ok=True)
@@ -66,13 +92,14 @@ class BatchProcessor:
             print(f"  Error reading {file_path.name}: {e}")
         return prompts
     
-    def generate_images(self, prompts: List[str], file_name: str) -> bool:
+    def generate_images(self, prompts: List[str], file_name: str, seed: int = None) -> bool:
         """
-        Generate images for a batch of prompts.
+        Generate one image for each prompt of a batch.
         
         Args:
             prompts: List of prompts to generate
             file_name: Name of the source file (for logging)
+            seed: Seed of the first prompt (random seeds if None)
         
         Returns:
             True if successful, False otherwise
@@ -80,45 +107,27 @@ class BatchProcessor:
         try:
             print(f"\n  Generating {len(prompts)} images...")
             
-            # Import here to ensure Fooocus is fully initialized
-            from webui import get_task, generate_clicked
-            
-            # Prepare arguments for image generation
-            # This mimics the Gradio interface arguments
-            args = [
-                None,  # currentTask placeholder
-                prompts[0] if prompts else "",  # First prompt as main prompt
-                "",  # negative_prompt
-                config.default_styles,  # style_selections
-                config.default_performance,  # performance_selection
-                config.default_aspect_ratio.split(' ')[0],  # aspect_ratios_selection
-                len(prompts),  # image_number
-                config.default_output_format,  # output_format
-                0,  # image_seed (will be randomized)
-                True,  # seed_random
-                False,  # image_prompt_checkbox
-                # ... add more default parameters as needed
-            ]
-            
-            # Create task
-            task = worker.AsyncTask(args=args)
-            task.image_number = len(prompts)
-            
-            # For multiple prompts, we need to process them individually
-            # This is a simplified approach - you may need to adjust based on Fooocus internals
-            for i, prompt in enumerate(prompts):
-                print(f"    [{i+1}/{len(prompts)}] {prompt[:60]}...")
-            
-            # Add task to queue
-            worker.async_tasks.append(task)
-            
-            # Wait for completion
-            print(f"  Waiting for generation to complete...")
-            while task.processing or len(task.yields) > 0:
-                time.sleep(1)
+            success = True
+            if self.task_per_prompt:
+                results = engine.run_prompts(prompts, seed=seed)
+                for i, (prompt, paths) in enumerate(results):
+                    if len(paths) == 0:
+                        print(f"    [{i+1}/{len(prompts)}] ✗ No image for: {prompt[:60]}")
+                        success = False
+                        continue
+                    print(f"    [{i+1}/{len(prompts)}] {prompt[:60]} -> {paths[-1]}")
+            else:
+                # one task for the whole batch, models and LoRAs are only refreshed once
+                paths = engine.run_prompt_batch(prompts, seed=seed)
+                for path in paths:
+                    print(f"    {path}")
+                if len(paths) < len(prompts):
+                    print(f"  ✗ Only {len(paths)} of {len(prompts)} images were generated")
+                    success = False
             
-            print(f"  ✓ Generation complete!")
-            return True
+            if success:
+                print(f"  ✓ Generation complete!")
+            return success
             
         except Exception as e:
             print(f"  ✗ Error during generation: {e}")
@@ -158,7 +167,8 @@ class BatchProcessor:
             
             print(f"\nBatch {batch_num}/{total_batches} ({len(batch)} prompts)")
             
-            if not self.generate_images(batch, file_path.name):
+            seed = None if self.seed is None else self.seed + i
+            if not self.generate_images(batch, file_path.name, seed=seed):
                 success = False
                 break
         
@@ -235,6 +245,7 @@ Examples:
   python batch_processor.py
   python batch_processor.py --prompts-dir my_prompts --batch-size 16
   python batch_processor.py --continuous --keep-files
+  python batch_processor.py --seed 1234 --preset realistic
   
 TXT File Format:
   - One prompt per line
@@ -264,6 +275,19 @@ TXT File Format:
         help='Number of images per batch (max 32, default: 32)'
     )
     
+    parser.add_argument(
+        '--seed',
+        type=int,
+        default=None,
+        help='Base seed, prompt i of a file uses seed + i (default: random)'
+    )
+    
+    parser.add_argument(
+        '--task-per-prompt',
+        action='store_true',
+        help='Queue a separate task for every prompt instead of one task per batch'
+    )
+    
     parser.add_argument(
         '--keep-files',
         action='store_true',
@@ -276,13 +300,22 @@ TXT File Format:
         help='Run continuously, checking for new files every 10 seconds'
     )
     
-    args = parser.parse_args()
+    # Everything not recognised here is passed on to Fooocus (e.g. --preset, --always-gpu)
+    args, fooocus_argv = parser.parse_known_args()
+    
+    # Fooocus resolves presets relative to its root, so make user paths absolute first
+    prompts_dir = os.path.abspath(args.prompts_dir)
+    if args.output_dir is not None:
+        fooocus_argv += ['--output-path', os.path.abspath(args.output_dir)]
+    
+    initialize_fooocus(fooocus_argv)
     
     # Create and run processor
     processor = BatchProcessor(
-        prompts_dir=args.prompts_dir,
-        output_dir=args.output_dir,
-        batch_size=args.batch_size
+        prompts_dir=prompts_dir,
+        batch_size=args.batch_size,
+        seed=args.seed,
+        task_per_prompt=args.task_per_prompt
     )
     
     processor.run(
@@ -0,0 +1,31 @@
+import time
+
+import torch
+
+from modules.anisotropic import adaptive_anisotropic_filter
+
+device = torch.device('cuda' if torch.cuda.is_available() else 'cpu')
+generator = torch.Generator().manual_seed(0)
+
+for size in [1024, 1536]:
+    x = torch.randn(1, 4, size // 8, size // 8, generator=generator).to(device)
+    g = torch.randn(1, 4, size // 8, size // 8, generator=generator).to(device)
+    reference = None
+
+    for rows_per_chunk in [13, 4, 1]:
+        adaptive_anisotropic_filter(x, g, rows_per_chunk=rows_per_chunk)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+            torch.cuda.reset_peak_memory_stats()
+
+        start = time.perf_counter()
+        result = adaptive_anisotropic_filter(x, g, rows_per_chunk=rows_per_chunk)
+        if device.type == 'cuda':
+            torch.cuda.synchronize()
+        elapsed = time.perf_counter() - start
+
+        if reference is None:
+            reference = result
+        memory = f', peak memory {torch.cuda.max_memory_allocated() / 1024 ** 2:.0f} MB' if device.type == 'cuda' else ''
+        print(f'{size}x{size} rows_per_chunk={rows_per_chunk}: {elapsed * 1000:.1f} ms{memory}, '
+              f'max difference {(result - reference).abs().max():.2e}')
@@ -0,0 +1,57 @@
+import time
+
+import cv2
+import numpy as np
+
+from modules.inpaint_worker import fooocus_fill, morphological_open, box_blur, max_filter_opencv
+
+
+def fooocus_fill_reference(image, mask):
+    current_image = image.copy()
+    raw_image = image.copy()
+    area = np.where(mask < 127)
+    store = raw_image[area]
+
+    for k, repeats in [(512, 2), (256, 2), (128, 4), (64, 4), (33, 8), (15, 8), (5, 16), (3, 16)]:
+        for _ in range(repeats):
+            current_image = box_blur(current_image, k)
+            current_image[area] = store
+
+    return current_image
+
+
+def morphological_open_reference(x):
+    x_int16 = np.zeros_like(x, dtype=np.int16)
+    x_int16[x > 127] = 256
+
+    for i in range(32):
+        maxed = max_filter_opencv(x_int16, ksize=3) - 8
+        x_int16 = np.maximum(maxed, x_int16)
+
+    return np.clip(x_int16, 0, 255).astype(np.uint8)
+
+
+def benchmark(name, function, reference, *args):
+    start = time.perf_counter()
+    expected = reference(*args)
+    reference_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    result = function(*args)
+    function_time = time.perf_counter() - start
+
+    difference = np.abs(result.astype(np.int16) - expected.astype(np.int16))
+    print(f'{name}: {reference_time:.2f}s -> {function_time:.2f}s, '
+          f'max difference {difference.max()}, mean difference {difference.mean():.4f}')
+
+
+for width, height in [(2048, 2048), (3840, 2160)]:
+    rng = np.random.default_rng(0)
+    image = cv2.resize(rng.integers(0, 256, size=(height // 32, width // 32, 3), dtype=np.uint8), (width, height))
+    mask = np.zeros((height, width), dtype=np.uint8)
+    cv2.circle(mask, (width // 2, height // 2), min(width, height) // 4, 255, -1)
+    mask[:, :width // 8] = 255
+
+    print(f'{width}x{height}')
+    benchmark('fooocus_fill', fooocus_fill, fooocus_fill_reference, image, mask)
+    benchmark('morphological_open', morphological_open, morphological_open_reference, mask)
@@ -0,0 +1,27 @@
+import os
+import time
+
+import numpy as np
+import torch
+
+from modules.upscaler import upscale_on_cpu
+
+rng = np.random.default_rng(0)
+image = rng.integers(0, 256, size=(768, 768, 3), dtype=np.uint8)
+cpu_count = os.cpu_count()
+
+reference = None
+for workers, bfloat16, channels_last in [(1, False, False), (2, False, False), (4, False, False),
+                                         (cpu_count, False, False), (4, False, True), (4, True, True)]:
+    upscale_on_cpu(image[:64, :64], workers=workers, bfloat16=bfloat16, channels_last=channels_last)
+
+    start = time.perf_counter()
+    result = upscale_on_cpu(image, workers=workers, bfloat16=bfloat16, channels_last=channels_last)
+    elapsed = time.perf_counter() - start
+
+    if reference is None:
+        reference = result
+    difference = np.abs(result.astype(np.int16) - reference.astype(np.int16))
+    megapixels = result.shape[0] * result.shape[1] / 1e6
+    print(f'workers={workers} bfloat16={bfloat16} channels_last={channels_last} threads={torch.get_num_threads()}: '
+          f'{megapixels / elapsed:.3f} output megapixels/s, max difference {difference.max()}')
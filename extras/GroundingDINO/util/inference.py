@@ -19,15 +19,7 @@ class GroundingDinoModel(Model):
         self.load_device = torch.device('cpu')
         self.offload_device = torch.device('cpu')
 
-    @torch.no_grad()
-    @torch.inference_mode()
-    def predict_with_caption(
-            self,
-            image: np.ndarray,
-            caption: str,
-            box_threshold: float = 0.35,
-            text_threshold: float = 0.25
-    ) -> Tuple[sv.Detections, torch.Tensor, torch.Tensor, List[str]]:
+    def prepare_model(self):
         if self.model is None:
             filename = load_file_from_url(
                 url="https://github.com/IDEA-Research/GroundingDINO/releases/download/v0.1.0-alpha/groundingdino_swint_ogc.pth",
@@ -44,21 +36,48 @@ class GroundingDinoModel(Model):
 
         model_management.load_model_gpu(self.model)
 
+    @torch.no_grad()
+    @torch.inference_mode()
+    def predict_with_caption(
+            self,
+            image: np.ndarray,
+            caption: str,
+            box_threshold: float = 0.35,
+            text_threshold: float = 0.25
+    ) -> Tuple[sv.Detections, torch.Tensor, torch.Tensor, List[str]]:
+        return self.predict_with_captions(image, [caption], [box_threshold], [text_threshold])[0]
+
+    @torch.no_grad()
+    @torch.inference_mode()
+    def predict_with_captions(
+            self,
+            image: np.ndarray,
+            captions: List[str],
+            box_thresholds: List[float],
+            text_thresholds: List[float]
+    ) -> List[Tuple[sv.Detections, torch.Tensor, torch.Tensor, List[str]]]:
+        """Detect each caption in the image, the image backbone only runs once for all captions."""
+        self.prepare_model()
+
         processed_image = GroundingDinoModel.preprocess_image(image_bgr=image).to(self.load_device)
-        boxes, logits, phrases = predict(
+        predictions = predict_many(
             model=self.model,
             image=processed_image,
-            caption=caption,
-            box_threshold=box_threshold,
-            text_threshold=text_threshold,
+            captions=captions,
+            box_thresholds=box_thresholds,
+            text_thresholds=text_thresholds,
             device=self.load_device)
+
+        results = []
         source_h, source_w, _ = image.shape
-        detections = GroundingDinoModel.post_process_result(
-            source_h=source_h,
-            source_w=source_w,
-            boxes=boxes,
-            logits=logits)
-        return detections, boxes, logits, phrases
+        for boxes, logits, phrases in predictions:
+            detections = GroundingDinoModel.post_process_result(
+                source_h=source_h,
+                source_w=source_w,
+                boxes=boxes,
+                logits=logits)
+            results.append((detections, boxes, logits, phrases))
+        return results
 
 
 def predict(
@@ -69,32 +88,63 @@ def predict(
         text_threshold: float,
         device: str = "cuda"
 ) -> Tuple[torch.Tensor, torch.Tensor, List[str]]:
-    caption = preprocess_caption(caption=caption)
+    return predict_many(model, image, [caption], [box_threshold], [text_threshold], device)[0]
+
 
+def predict_many(
+        model,
+        image: torch.Tensor,
+        captions: List[str],
+        box_thresholds: List[float],
+        text_thresholds: List[float],
+        device: str = "cuda"
+) -> List[Tuple[torch.Tensor, torch.Tensor, List[str]]]:
     # override to use model wrapped by patcher
     model = model.model.to(device)
     image = image.to(device)
 
-    with torch.no_grad():
-        outputs = model(image[None], captions=[caption])
+    # the backbone only depends on the image, compute its features once and reuse them for every caption
+    backbone_features = []
+
+    def backbone_forward(samples):
+        if len(backbone_features) == 0:
+            backbone_features.append(backbone_forward_origin(samples))
+        features, poss = backbone_features[0]
+        return list(features), list(poss)
+
+    backbone_forward_origin = model.backbone.forward
+    model.backbone.forward = backbone_forward
+
+    results = []
+    try:
+        for caption, box_threshold, text_threshold in zip(captions, box_thresholds, text_thresholds):
+            caption = preprocess_caption(caption=caption)
+
+            with torch.no_grad():
+                outputs = model(image[None], captions=[caption])
+
+            prediction_logits = outputs["pred_logits"].cpu().sigmoid()[0]  # prediction_logits.shape = (nq, 256)
+            prediction_boxes = outputs["pred_boxes"].cpu()[0]  # prediction_boxes.shape = (nq, 4)
 
-    prediction_logits = outputs["pred_logits"].cpu().sigmoid()[0]  # prediction_logits.shape = (nq, 256)
-    prediction_boxes = outputs["pred_boxes"].cpu()[0]  # prediction_boxes.shape = (nq, 4)
+            mask = prediction_logits.max(dim=1)[0] > box_threshold
+            logits = prediction_logits[mask]  # logits.shape = (n, 256)
+            boxes = prediction_boxes[mask]  # boxes.shape = (n, 4)
 
-    mask = prediction_logits.max(dim=1)[0] > box_threshold
-    logits = prediction_logits[mask]  # logits.shape = (n, 256)
-    boxes = prediction_boxes[mask]  # boxes.shape = (n, 4)
+            tokenizer = model.tokenizer
+            tokenized = tokenizer(caption)
 
-    tokenizer = model.tokenizer
-    tokenized = tokenizer(caption)
+            phrases = [
+                get_phrases_from_posmap(logit > text_threshold, tokenized, tokenizer).replace('.', '')
+                for logit
+                in logits
+            ]
 
-    phrases = [
-        get_phrases_from_posmap(logit > text_threshold, tokenized, tokenizer).replace('.', '')
-        for logit
-        in logits
-    ]
+            results.append((boxes, logits.max(dim=1)[0], phrases))
+    finally:
+        del model.backbone.forward
 
-    return boxes, logits.max(dim=1)[0], phrases
+    return results
 
 
-default_groundingdino = GroundingDinoModel().predict_with_caption
+default_groundingdino_model = GroundingDinoModel()
+default_groundingdino = default_groundingdino_model.predict_with_caption
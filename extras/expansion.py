@@ -6,13 +6,18 @@
 
 
 import os
+import json
+import hashlib
 import torch
 import math
+import args_manager
 import ldm_patched.modules.model_management as model_management
 
 from transformers.generation.logits_process import LogitsProcessorList
 from transformers import AutoTokenizer, AutoModelForCausalLM, set_seed
-from modules.config import path_fooocus_expansion
+from modules.config import path_fooocus_expansion, path_cache
+from modules.lru_cache import LRUCache
+from modules.hash_cache import get_file_signature
 from ldm_patched.modules.model_patcher import ModelPatcher
 
 
@@ -78,6 +83,59 @@ class FooocusExpansion:
         self.patcher = ModelPatcher(self.model, load_device=load_device, offload_device=offload_device)
         print(f'Fooocus Expansion engine loaded for {load_device}, use_fp16 = {use_fp16}.')
 
+        # results depend on the model weights and on the precision they are sampled with
+        model_filename = os.path.join(path_fooocus_expansion, 'pytorch_model.bin')
+        model_signature = get_file_signature(model_filename) if os.path.exists(model_filename) else path_fooocus_expansion
+        self.cache_signature = [model_signature, load_device.type, use_fp16]
+        self.cache = LRUCache(max_items=args_manager.args.expansion_cache_size)
+        self.cache_filename = os.path.join(path_cache, 'expansion_cache.txt')
+        self.cache_file_entries = 0
+        if args_manager.args.expansion_cache_file:
+            self.load_cache_from_file()
+
+    def get_cache_key(self, prompt, seed):
+        return hashlib.sha256(json.dumps([self.cache_signature, prompt, seed]).encode('utf-8')).hexdigest()
+
+    def load_cache_from_file(self):
+        try:
+            if os.path.exists(self.cache_filename):
+                with open(self.cache_filename, 'rt', encoding='utf-8') as fp:
+                    for line in fp:
+                        for key, expansion in json.loads(line).items():
+                            self.cache.put(key, expansion)
+                            self.cache_file_entries += 1
+                print(f'Fooocus Expansion cache loaded with {len(self.cache)} entries.')
+                if self.cache_file_entries > 2 * args_manager.args.expansion_cache_size:
+                    self.compact_cache_file()
+        except Exception as e:
+            print(f'[Expansion Cache] Loading failed: {e}')
+
+    def save_to_cache(self, key, expansion):
+        if args_manager.args.expansion_cache_size <= 0:
+            return
+        self.cache.put(key, expansion)
+        if args_manager.args.expansion_cache_file:
+            try:
+                with open(self.cache_filename, 'at', encoding='utf-8') as fp:
+                    json.dump({key: expansion}, fp)
+                    fp.write('\n')
+                self.cache_file_entries += 1
+                # the file is append only, rewrite it with the cached entries once it holds twice as many
+                if self.cache_file_entries > 2 * args_manager.args.expansion_cache_size:
+                    self.compact_cache_file()
+            except Exception as e:
+                print(f'[Expansion Cache] Saving failed: {e}')
+
+    def compact_cache_file(self):
+        items = self.cache.items()
+        temp_filename = f'{self.cache_filename}.tmp'
+        with open(temp_filename, 'wt', encoding='utf-8') as fp:
+            for key, expansion in items:
+                json.dump({key: expansion}, fp)
+                fp.write('\n')
+        os.replace(temp_filename, self.cache_filename)
+        self.cache_file_entries = len(items)
+
     @torch.no_grad()
     @torch.inference_mode()
     def logits_processor(self, input_ids, scores):
@@ -93,16 +151,62 @@ class FooocusExpansion:
     @torch.no_grad()
     @torch.inference_mode()
     def __call__(self, prompt, seed):
-        if prompt == '':
-            return ''
+        return self.expand_many([prompt], [seed], batch_size=1)[0]
+
+    @torch.no_grad()
+    @torch.inference_mode()
+    def expand_many(self, prompts, seeds, batch_size=None):
+        """
+        Expand several prompts. Cached results are reused, identical (prompt, seed) pairs are only
+        generated once and the rest is generated in padded batches of batch_size rows.
+        """
+        if batch_size is None:
+            batch_size = args_manager.args.expansion_batch_size
+
+        results = [''] * len(prompts)
+        pending = {}
+
+        for i, (prompt, seed) in enumerate(zip(prompts, seeds)):
+            if prompt == '':
+                continue
+            seed = int(seed) % SEED_LIMIT_NUMPY
+            prompt = safe_str(prompt) + ','
+            key = self.get_cache_key(prompt, seed)
+            cached = self.cache.get(key)
+            if cached is not None:
+                results[i] = cached
+                continue
+            if key not in pending:
+                pending[key] = (prompt, seed, [])
+            pending[key][2].append(i)
+
+        if len(pending) == 0:
+            return results
 
         if self.patcher.current_device != self.patcher.load_device:
             print('Fooocus Expansion loaded by itself.')
             model_management.load_model_gpu(self.patcher)
 
-        seed = int(seed) % SEED_LIMIT_NUMPY
+        pending = list(pending.items())
+        batch_size = max(int(batch_size), 1)
+        for start in range(0, len(pending), batch_size):
+            batch = pending[start:start + batch_size]
+            if len(batch) == 1:
+                expansions = [self.generate(batch[0][1][0], batch[0][1][1])]
+            else:
+                expansions = self.generate_batch([prompt for _, (prompt, _, _) in batch],
+                                                 [seed for _, (_, seed, _) in batch])
+            for (key, (_, _, indices)), expansion in zip(batch, expansions):
+                self.save_to_cache(key, expansion)
+                for i in indices:
+                    results[i] = expansion
+
+        return results
+
+    @torch.no_grad()
+    @torch.inference_mode()
+    def generate(self, prompt, seed):
         set_seed(seed)
-        prompt = safe_str(prompt) + ','
 
         tokenized_kwargs = self.tokenizer(prompt, return_tensors="pt")
         tokenized_kwargs.data['input_ids'] = tokenized_kwargs.data['input_ids'].to(self.patcher.load_device)
@@ -127,3 +231,75 @@ class FooocusExpansion:
         result = safe_str(response[0])
 
         return result
+
+    @torch.no_grad()
+    @torch.inference_mode()
+    def generate_batch(self, prompts, seeds, top_k=100):
+        """
+        Sample several prompts in one left-padded batch. Every row has its own generator seeded like
+        set_seed() seeds the global one, so rows draw the same samples as self.generate().
+        """
+        device = self.patcher.load_device
+        token_ids = [self.tokenizer(prompt)['input_ids'] for prompt in prompts]
+        lengths = [len(ids) for ids in token_ids]
+        max_new_tokens = [75 * int(math.ceil(float(n) / 75.0)) - n for n in lengths]
+
+        max_length = max(lengths)
+        pad_id = self.tokenizer.eos_token_id
+        input_ids = torch.tensor([[pad_id] * (max_length - len(ids)) + ids for ids in token_ids], device=device)
+        attention_mask = torch.tensor([[0] * (max_length - len(ids)) + [1] * len(ids) for ids in token_ids],
+                                      device=device)
+
+        generators = [torch.Generator(device=device).manual_seed(seed) for seed in seeds]
+        generated = [[] for _ in prompts]
+
+        # tokens of each row that must not be repeated, padding excluded
+        used_tokens = [torch.tensor(ids, device=device).long() for ids in token_ids]
+
+        past_key_values = None
+        step_ids = input_ids
+        for step in range(max(max_new_tokens)):
+            position_ids = attention_mask.long().cumsum(-1) - 1
+            position_ids.masked_fill_(attention_mask == 0, 1)
+            if past_key_values is not None:
+                position_ids = position_ids[:, -1:]
+
+            outputs = self.model(input_ids=step_ids, attention_mask=attention_mask, position_ids=position_ids,
+                                 past_key_values=past_key_values, use_cache=True)
+            past_key_values = outputs.past_key_values
+            scores = outputs.logits[:, -1, :].clone()
+
+            self.logits_bias = self.logits_bias.to(scores)
+            bias = self.logits_bias.repeat(len(prompts), 1)
+            for row, tokens in enumerate(used_tokens):
+                bias[row, tokens] = neg_inf
+            bias[:, 11] = 0
+            scores = scores + bias
+
+            threshold = torch.topk(scores, min(top_k, scores.shape[-1]))[0][..., -1, None]
+            scores = scores.masked_fill(scores < threshold, -float('inf'))
+            probs = torch.nn.functional.softmax(scores, dim=-1)
+
+            next_tokens = []
+            for row in range(len(prompts)):
+                if step < max_new_tokens[row]:
+                    token = torch.multinomial(probs[row:row + 1], num_samples=1, generator=generators[row])
+                    token = int(token[0, 0])
+                    generated[row].append(token)
+                    used_tokens[row] = torch.cat([used_tokens[row], torch.tensor([token], device=device)])
+                else:
+                    token = pad_id
+                next_tokens.append(token)
+
+            step_ids = torch.tensor(next_tokens, device=device)[:, None]
+            attention_mask = torch.cat([attention_mask, torch.ones_like(step_ids)], dim=1)
+
+        results = []
+        for prompt, ids, tokens, new_tokens in zip(prompts, token_ids, generated, max_new_tokens):
+            if new_tokens == 0:
+                results.append(prompt[:-1])
+                continue
+            response = self.tokenizer.decode(ids + tokens, skip_special_tokens=True)
+            results.append(safe_str(response))
+
+        return results
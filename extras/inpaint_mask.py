@@ -1,10 +1,13 @@
+import hashlib
 import sys
+import threading
 
 import modules.config
 import numpy as np
 import torch
-from extras.GroundingDINO.util.inference import default_groundingdino
+from extras.GroundingDINO.util.inference import default_groundingdino, default_groundingdino_model
 from extras.sam.predictor import SamPredictor
+from modules.lru_cache import LRUCache
 from rembg import remove, new_session
 from segment_anything import sam_model_registry
 from segment_anything.utils.amg import remove_small_regions
@@ -32,6 +35,45 @@ class SAMOptions:
         self.model_type = model_type
 
 
+# SAM models are wrapped in a ModelPatcher by SamPredictor, so VRAM is managed by model_management
+sam_predictors = LRUCache(max_items=2)
+sam_embeddings = LRUCache(max_items=4)
+sam_lock = threading.Lock()
+rembg_sessions = LRUCache(max_items=4)
+
+
+def get_sam_predictor(model_type):
+    sam_predictor = sam_predictors.get(model_type)
+    if sam_predictor is None:
+        sam_checkpoint = modules.config.download_sam_model(model_type)
+        sam_predictor = SamPredictor(sam_model_registry[model_type](checkpoint=sam_checkpoint))
+        sam_predictors.put(model_type, sam_predictor)
+    return sam_predictor
+
+
+def set_sam_image(sam_predictor, model_type, image):
+    """Same as sam_predictor.set_image, reuses the embedding if the image was encoded before."""
+    image = np.ascontiguousarray(image)
+    key = (model_type, image.shape, hashlib.sha1(image.data).hexdigest())
+    embedding = sam_embeddings.get(key)
+    if embedding is not None:
+        sam_predictor.features, sam_predictor.original_size, sam_predictor.input_size = embedding
+        sam_predictor.is_image_set = True
+        return
+
+    sam_predictor.set_image(image)
+    sam_embeddings.put(key, (sam_predictor.features, sam_predictor.original_size, sam_predictor.input_size))
+
+
+def get_rembg_session(mask_model, extras):
+    key = (mask_model, str(sorted(extras.items())))
+    session = rembg_sessions.get(key)
+    if session is None:
+        session = new_session(mask_model, **extras)
+        rembg_sessions.put(key, session)
+    return session
+
+
 def optimize_masks(masks: torch.Tensor) -> torch.Tensor:
     """
     removes small disconnected regions and holes
@@ -61,7 +103,7 @@ def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=
     if mask_model != 'sam' or sam_options is None:
         result = remove(
             image,
-            session=new_session(mask_model, **extras),
+            session=get_rembg_session(mask_model, extras),
             only_mask=True,
             **extras
         )
@@ -75,21 +117,45 @@ def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=
         text_threshold=sam_options.dino_text_threshold
     )
 
+    return generate_sam_mask(image, sam_options, boxes, logits)
+
+
+def generate_masks_from_image(image: np.ndarray, sam_options_list: list[SAMOptions]) -> list[tuple[np.ndarray | None, int, int, int]]:
+    """
+    Same as generate_mask_from_image with mask_model 'sam' for several prompts on one image.
+    GroundingDINO runs its image backbone and SAM encodes the image only once for all prompts.
+    """
+    if image is None:
+        return [(None, 0, 0, 0) for _ in sam_options_list]
+
+    if 'image' in image:
+        image = image['image']
+
+    predictions = default_groundingdino_model.predict_with_captions(
+        image=image,
+        captions=[x.dino_prompt for x in sam_options_list],
+        box_thresholds=[x.dino_box_threshold for x in sam_options_list],
+        text_thresholds=[x.dino_text_threshold for x in sam_options_list]
+    )
+
+    return [generate_sam_mask(image, sam_options, boxes, logits)
+            for sam_options, (detections, boxes, logits, phrases) in zip(sam_options_list, predictions)]
+
+
+def generate_sam_mask(image: np.ndarray, sam_options: SAMOptions, boxes: torch.Tensor,
+                      logits: torch.Tensor) -> tuple[np.ndarray, int, int, int]:
+    sam_detection_count = 0
+    sam_detection_on_mask_count = 0
+
     H, W = image.shape[0], image.shape[1]
     boxes = boxes * torch.Tensor([W, H, W, H])
     boxes[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
     boxes[:, 2:] = boxes[:, 2:] + boxes[:, :2]
 
-    sam_checkpoint = modules.config.download_sam_model(sam_options.model_type)
-    sam = sam_model_registry[sam_options.model_type](checkpoint=sam_checkpoint)
-
-    sam_predictor = SamPredictor(sam)
     final_mask_tensor = torch.zeros((image.shape[0], image.shape[1]))
     dino_detection_count = boxes.size(0)
 
     if dino_detection_count > 0:
-        sam_predictor.set_image(image)
-
         if sam_options.dino_erode_or_dilate != 0:
             for index in range(boxes.size(0)):
                 assert boxes.size(1) == 4
@@ -106,13 +172,16 @@ def generate_mask_from_image(image: np.ndarray, mask_model: str = 'sam', extras=
                 draw.rectangle(box.tolist(), fill="white")
             return np.array(debug_dino_image), dino_detection_count, sam_detection_count, sam_detection_on_mask_count
 
-        transformed_boxes = sam_predictor.transform.apply_boxes_torch(boxes, image.shape[:2])
-        masks, _, _ = sam_predictor.predict_torch(
-            point_coords=None,
-            point_labels=None,
-            boxes=transformed_boxes,
-            multimask_output=False,
-        )
+        with sam_lock:
+            sam_predictor = get_sam_predictor(sam_options.model_type)
+            set_sam_image(sam_predictor, sam_options.model_type, image)
+            transformed_boxes = sam_predictor.transform.apply_boxes_torch(boxes, image.shape[:2])
+            masks, _, _ = sam_predictor.predict_torch(
+                point_coords=None,
+                point_labels=None,
+                boxes=transformed_boxes,
+                multimask_output=False,
+            )
 
         masks = optimize_masks(masks)
         sam_detection_count = len(masks)
@@ -46,14 +46,23 @@ class ImageUpscaleWithModel:
         tile = 512
         overlap = 32
 
+        # rough activation memory of an RRDB tile, run as many tiles per call as fit in free memory
+        tile_batch_size = 1
+        if device.type != 'cpu':
+            tile_memory = tile * tile * in_img.element_size() * (256 + 64 * upscale_model.scale ** 2)
+            tile_batch_size = int(max(1, min(8, free_memory * 0.8 // tile_memory)))
+
         oom = True
         while oom:
             try:
                 steps = in_img.shape[0] * ldm_patched.modules.utils.get_tiled_scale_steps(in_img.shape[3], in_img.shape[2], tile_x=tile, tile_y=tile, overlap=overlap)
                 pbar = ldm_patched.modules.utils.ProgressBar(steps)
-                s = ldm_patched.modules.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar)
+                s = ldm_patched.modules.utils.tiled_scale(in_img, lambda a: upscale_model(a), tile_x=tile, tile_y=tile, overlap=overlap, upscale_amount=upscale_model.scale, pbar=pbar, tile_batch_size=tile_batch_size)
                 oom = False
             except model_management.OOM_EXCEPTION as e:
+                if tile_batch_size > 1:
+                    tile_batch_size //= 2
+                    continue
                 tile //= 2
                 if tile < 128:
                     raise e
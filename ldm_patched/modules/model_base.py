@@ -156,14 +156,17 @@ class BaseModel(torch.nn.Module):
         return out
 
     def load_model_weights(self, sd, unet_prefix=""):
-        to_load = {}
-        keys = list(sd.keys())
-        for k in keys:
-            if k.startswith(unet_prefix):
-                to_load[k[len(unet_prefix):]] = sd.pop(k)
+        if isinstance(sd, utils.LazySafetensorsDict):
+            to_load = sd.pop_prefix(unet_prefix)
+        else:
+            to_load = {}
+            keys = list(sd.keys())
+            for k in keys:
+                if k.startswith(unet_prefix):
+                    to_load[k[len(unet_prefix):]] = sd.pop(k)
 
         to_load = self.model_config.process_unet_state_dict(to_load)
-        m, u = self.diffusion_model.load_state_dict(to_load, strict=False)
+        m, u = utils.load_state_dict(self.diffusion_model, to_load)
         if len(m) > 0:
             print("unet missing:", m)
 
@@ -6,6 +6,11 @@ import ldm_patched.modules.utils
 import ldm_patched.modules.model_management
 
 class ModelPatcher:
+    # keep patched weights in the model on unpatch and only recompute keys whose patches changed on the next patch
+    incremental_weight_patching = False
+    keys_recomputed = 0
+    keys_skipped = 0
+
     def __init__(self, model, load_device, offload_device, size=0, current_device=None, weight_inplace_update=False):
         self.size = size
         self.model = model
@@ -153,6 +158,7 @@ class ModelPatcher:
 
     def get_key_patches(self, filter_prefix=None):
         ldm_patched.modules.model_management.unload_model_clones(self)
+        self.restore_weights()
         model_sd = self.model_state_dict()
         p = {}
         for k in model_sd:
@@ -181,7 +187,13 @@ class ModelPatcher:
                 self.object_patches_backup[k] = old
             setattr(self.model, k, self.object_patches[k])
 
-        if patch_weights:
+        if patch_weights and self.incremental_weight_patching:
+            self.patch_weights_incremental(device_to)
+
+            if device_to is not None:
+                self.model.to(device_to)
+                self.current_device = device_to
+        elif patch_weights:
             model_sd = self.model_state_dict()
             for key in self.patches:
                 if key not in model_sd:
@@ -212,6 +224,66 @@ class ModelPatcher:
 
         return self.model
 
+    @staticmethod
+    def same_patches(a, b):
+        if len(a) != len(b):
+            return False
+        return all(x[0] == y[0] and x[1] is y[1] and x[2] == y[2] for x, y in zip(a, b))
+
+    def set_weight(self, key, weight):
+        if self.weight_inplace_update:
+            ldm_patched.modules.utils.copy_to_param(self.model, key, weight)
+        else:
+            ldm_patched.modules.utils.set_attr(self.model, key, weight)
+
+    def patch_weights_incremental(self, device_to=None):
+        # the applied patches and the original weights are kept on the model, so that clones share them
+        applied = self.model.__dict__.setdefault('applied_weight_patches', {})
+        backup = self.model.__dict__.setdefault('weight_patch_backup', {})
+        model_sd = self.model_state_dict()
+        recomputed = 0
+        skipped = 0
+
+        for key in list(applied.keys()) + [x for x in self.patches if x not in applied]:
+            if key not in model_sd:
+                print("could not patch. key doesn't exist in model:", key)
+                continue
+
+            patches = self.patches.get(key, [])
+            if key in applied and self.same_patches(applied[key], patches):
+                skipped += 1
+                continue
+
+            if key not in backup:
+                backup[key] = model_sd[key].to(device=self.offload_device, copy=self.weight_inplace_update)
+
+            if len(patches) == 0:
+                self.set_weight(key, backup.pop(key))
+                applied.pop(key)
+            else:
+                weight = backup[key]
+                if device_to is not None:
+                    temp_weight = ldm_patched.modules.model_management.cast_to_device(weight, device_to, torch.float32, copy=True)
+                else:
+                    temp_weight = weight.to(torch.float32, copy=True)
+                self.set_weight(key, self.calculate_weight(patches, temp_weight, key).to(weight.dtype))
+                applied[key] = patches[:]
+                del temp_weight
+
+            recomputed += 1
+
+        ModelPatcher.keys_recomputed += recomputed
+        ModelPatcher.keys_skipped += skipped
+        if recomputed > 0:
+            print(f'Patched weights of {recomputed} keys, {skipped} keys unchanged.')
+
+    def restore_weights(self):
+        """Restore the original weights that incremental patching left in the model."""
+        backup = self.model.__dict__.pop('weight_patch_backup', {})
+        self.model.__dict__.pop('applied_weight_patches', None)
+        for key, weight in backup.items():
+            self.set_weight(key, weight)
+
     def calculate_weight(self, patches, weight, key):
         for p in patches:
             alpha = p[0]
@@ -23,7 +23,7 @@ import ldm_patched.modules.supported_models_base
 import ldm_patched.taesd.taesd
 
 def load_model_weights(model, sd):
-    m, u = model.load_state_dict(sd, strict=False)
+    m, u = ldm_patched.modules.utils.load_state_dict(model, sd)
     m = set(m)
     unexpected_keys = set(u)
 
@@ -428,7 +428,7 @@ def load_checkpoint(config_path=None, ckpt_path=None, output_vae=True, output_cl
     return (ldm_patched.modules.model_patcher.ModelPatcher(model, load_device=model_management.get_torch_device(), offload_device=offload_device), clip, vae)
 
 def load_checkpoint_guess_config(ckpt_path, output_vae=True, output_clip=True, output_clipvision=False, embedding_directory=None, output_model=True, vae_filename_param=None):
-    sd = ldm_patched.modules.utils.load_torch_file(ckpt_path)
+    sd = ldm_patched.modules.utils.load_torch_file(ckpt_path, lazy=True)
     sd_keys = sd.keys()
     clip = None
     clipvision = None
@@ -1,15 +1,102 @@
 import torch
 import math
+import copy
 import struct
 import ldm_patched.modules.checkpoint_pickle
 import safetensors.torch
 import numpy as np
+from collections import deque
+from collections.abc import MutableMapping
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 
-def load_torch_file(ckpt, safe_load=False, device=None):
+
+class LazySafetensorsDict(MutableMapping):
+    """
+    State dict backed by a memory-mapped safetensors file. A tensor is read from the file the first time it is
+    accessed and kept until it is removed. load_state_dict() loads it into a module one tensor at a time.
+    """
+
+    def __init__(self, ckpt, device="cpu"):
+        self.file = safetensors.safe_open(ckpt, framework="pt", device=device)
+        # key -> name of the tensor in the file, keys can be renamed before the tensor is read
+        self.pending = {key: key for key in self.file.keys()}
+        self.values = {}
+
+    def __getitem__(self, key):
+        if key in self.values:
+            return self.values[key]
+        if key in self.pending:
+            value = self.file.get_tensor(self.pending.pop(key))
+            self.values[key] = value
+            return value
+        raise KeyError(key)
+
+    def __setitem__(self, key, value):
+        self.pending.pop(key, None)
+        self.values[key] = value
+
+    def __delitem__(self, key):
+        if key in self.values:
+            del self.values[key]
+        elif key in self.pending:
+            del self.pending[key]
+        else:
+            raise KeyError(key)
+
+    def __iter__(self):
+        yield from list(self.pending)
+        yield from list(self.values)
+
+    def __len__(self):
+        return len(self.pending) + len(self.values)
+
+    def __contains__(self, key):
+        return key in self.pending or key in self.values
+
+    def nelement(self, key):
+        if key in self.pending:
+            return math.prod(self.file.get_slice(self.pending[key]).get_shape())
+        return self[key].nelement()
+
+    def pop_prefix(self, prefix):
+        """Remove the keys starting with prefix and return them without the prefix, without reading any tensor."""
+        out = copy.copy(self)
+        out.pending = {k[len(prefix):]: self.pending.pop(k) for k in list(self.pending) if k.startswith(prefix)}
+        out.values = {k[len(prefix):]: self.values.pop(k) for k in list(self.values) if k.startswith(prefix)}
+        return out
+
+def load_state_dict(module, sd):
+    """
+    module.load_state_dict(sd, strict=False) for a LazySafetensorsDict, which torch would copy and so read in full.
+    Tensors are read, copied into the module and removed from sd one at a time.
+    Returns the missing and unexpected keys.
+    """
+    if not isinstance(sd, LazySafetensorsDict):
+        return module.load_state_dict(sd, strict=False)
+
+    own_state = module.state_dict(keep_vars=True)
+    missing = [k for k in own_state if k not in sd]
+    unexpected = [k for k in sd if k not in own_state]
+
+    with torch.no_grad():
+        for k, param in own_state.items():
+            if k not in sd:
+                continue
+            value = sd.pop(k)
+            if value.shape != param.shape:
+                raise RuntimeError("Error(s) in loading state_dict for {}: size mismatch for {}: copying a param with shape {} from checkpoint, the shape in current model is {}.".format(module.__class__.__name__, k, value.shape, param.shape))
+            param.copy_(value)
+            del value
+
+    return missing, unexpected
+
+def load_torch_file(ckpt, safe_load=False, device=None, lazy=False):
     if device is None:
         device = torch.device("cpu")
-    if ckpt.lower().endswith(".safetensors"):
+    if ckpt.lower().endswith(".safetensors") and lazy:
+        sd = LazySafetensorsDict(ckpt, device=device.type)
+    elif ckpt.lower().endswith(".safetensors"):
         sd = safetensors.torch.load_file(ckpt, device=device.type)
     else:
         if safe_load:
@@ -38,7 +125,7 @@ def calculate_parameters(sd, prefix=""):
     params = 0
     for k in sd.keys():
         if k.startswith(prefix):
-            params += sd[k].nelement()
+            params += sd.nelement(k) if isinstance(sd, LazySafetensorsDict) else sd[k].nelement()
     return params
 
 def state_dict_key_replace(state_dict, keys_to_replace):
@@ -404,33 +491,74 @@ def common_upscale(samples, width, height, upscale_method, crop):
 def get_tiled_scale_steps(width, height, tile_x, tile_y, overlap):
     return math.ceil((height / (tile_y - overlap))) * math.ceil((width / (tile_x - overlap)))
 
+def get_feather_mask(height, width, feather, device="cpu"):
+    """Tile weights fading in linearly over feather pixels from every border, multiplied where borders overlap."""
+    def ramp(size):
+        t = torch.arange(size, dtype=torch.float32, device=device)
+        if feather <= 0:
+            return torch.ones_like(t)
+        return torch.clamp((t + 1) / feather, max=1.0) * torch.clamp((size - t) / feather, max=1.0)
+
+    return ramp(height)[:, None] * ramp(width)[None, :]
+
 @torch.inference_mode()
-def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None):
+def tiled_scale(samples, function, tile_x=64, tile_y=64, overlap = 8, upscale_amount = 4, out_channels = 3, output_device="cpu", pbar = None, tile_batch_size = 1, workers = 1):
     output = torch.empty((samples.shape[0], out_channels, round(samples.shape[2] * upscale_amount), round(samples.shape[3] * upscale_amount)), device=output_device)
+    feather = round(overlap * upscale_amount)
+    feather_masks = {}
+    executor = ThreadPoolExecutor(max_workers=workers) if workers > 1 else None
     for b in range(samples.shape[0]):
         s = samples[b:b+1]
         out = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
-        out_div = torch.zeros((s.shape[0], out_channels, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
+        out_div = torch.zeros((s.shape[0], 1, round(s.shape[2] * upscale_amount), round(s.shape[3] * upscale_amount)), device=output_device)
+
+        # tiles of the same shape are stacked so that up to tile_batch_size of them run in one call
+        tiles = {}
         for y in range(0, s.shape[2], tile_y - overlap):
             for x in range(0, s.shape[3], tile_x - overlap):
-                s_in = s[:,:,y:y+tile_y,x:x+tile_x]
-
-                ps = function(s_in).to(output_device)
-                mask = torch.ones_like(ps)
-                feather = round(overlap * upscale_amount)
-                for t in range(feather):
-                        mask[:,:,t:1+t,:] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,mask.shape[2] -1 -t: mask.shape[2]-t,:] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,:,t:1+t] *= ((1.0/feather) * (t + 1))
-                        mask[:,:,:,mask.shape[3]- 1 - t: mask.shape[3]- t] *= ((1.0/feather) * (t + 1))
-                out[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += ps * mask
-                out_div[:,:,round(y*upscale_amount):round((y+tile_y)*upscale_amount),round(x*upscale_amount):round((x+tile_x)*upscale_amount)] += mask
+                shape = tuple(s[:,:,y:y+tile_y,x:x+tile_x].shape[2:])
+                tiles.setdefault(shape, []).append((y, x))
+
+        batches = [positions[i:i+tile_batch_size] for positions in tiles.values() for i in range(0, len(positions), tile_batch_size)]
+
+        def process(batch):
+            s_in = torch.cat([s[:,:,y:y+tile_y,x:x+tile_x] for y, x in batch])
+            return function(s_in).to(output_device, dtype=out.dtype)
+
+        if executor is None:
+            results = map(process, batches)
+        else:
+            # batches run in the worker threads, at most two per worker are pending at a time
+            results = executor_map_window(executor, process, batches, window=2 * workers)
+
+        for batch, ps in zip(batches, results):
+            if ps.shape[2:] not in feather_masks:
+                feather_masks[ps.shape[2:]] = get_feather_mask(ps.shape[2], ps.shape[3], feather, output_device)
+            mask = feather_masks[ps.shape[2:]]
+
+            for (y, x), p in zip(batch, ps):
+                area = (slice(None), slice(None), slice(round(y*upscale_amount), round((y+tile_y)*upscale_amount)), slice(round(x*upscale_amount), round((x+tile_x)*upscale_amount)))
+                out[area].addcmul_(p[None], mask)
+                out_div[area] += mask
                 if pbar is not None:
                     pbar.update(1)
 
         output[b:b+1] = out/out_div
+
+    if executor is not None:
+        executor.shutdown()
     return output
 
+def executor_map_window(executor, function, items, window):
+    """Like executor.map, but only submits up to window items ahead of the result being consumed."""
+    pending = deque()
+    for item in items:
+        pending.append(executor.submit(function, item))
+        if len(pending) >= window:
+            yield pending.popleft().result()
+    while len(pending) > 0:
+        yield pending.popleft().result()
+
 PROGRESS_BAR_ENABLED = True
 def set_progress_bar_enabled(enabled):
     global PROGRESS_BAR_ENABLED
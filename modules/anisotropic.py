@@ -115,6 +115,64 @@ def _bilateral_blur(
     return out
 
 
+def _bilateral_blur_chunked(
+    input: Tensor,
+    guidance: Tensor | None,
+    kernel_size: tuple[int, int] | int,
+    sigma_color: float | Tensor,
+    sigma_space: tuple[float, float] | Tensor,
+    border_type: str = 'reflect',
+    color_distance_type: str = 'l1',
+    rows_per_chunk: int = 1,
+) -> Tensor:
+    """
+    Same result as _bilateral_blur, but accumulates the weighted sums over chunks of kernel rows,
+    so the unfolded tensors are (B, C, H, W, rows_per_chunk x Kx) instead of (B, C, H, W, Ky x Kx).
+    """
+
+    if isinstance(sigma_color, Tensor):
+        sigma_color = sigma_color.to(device=input.device, dtype=input.dtype).view(-1, 1, 1, 1, 1)
+
+    ky, kx = _unpack_2d_ks(kernel_size)
+    pad_y, pad_x = _compute_zero_padding(kernel_size)
+    H, W = input.shape[-2:]
+
+    padded_input = pad(input, (pad_x, pad_x, pad_y, pad_y), mode=border_type)
+    if guidance is None:
+        guidance = input
+        padded_guidance = padded_input
+    else:
+        padded_guidance = pad(guidance, (pad_x, pad_x, pad_y, pad_y), mode=border_type)
+
+    space_kernel = get_gaussian_kernel2d(kernel_size, sigma_space, device=input.device, dtype=input.dtype)
+    space_kernel = space_kernel.view(-1, 1, 1, 1, ky, kx)
+
+    numerator = torch.zeros_like(input)
+    denominator = torch.zeros_like(input[:, :1])
+
+    for start in range(0, ky, rows_per_chunk):
+        rows = min(rows_per_chunk, ky - start)
+        unfolded_input = padded_input[:, :, start:start + rows + H - 1].unfold(2, rows, 1).unfold(3, kx, 1).flatten(-2)
+        unfolded_guidance = padded_guidance[:, :, start:start + rows + H - 1].unfold(2, rows, 1).unfold(3, kx, 1).flatten(-2)
+
+        diff = unfolded_guidance - guidance.unsqueeze(-1)
+        if color_distance_type == "l1":
+            color_distance_sq = diff.abs().sum(1, keepdim=True).square()
+        elif color_distance_type == "l2":
+            color_distance_sq = diff.square().sum(1, keepdim=True)
+        else:
+            raise ValueError("color_distance_type only acceps l1 or l2")
+        del diff
+        kernel = (-0.5 / sigma_color**2 * color_distance_sq).exp()  # (B, 1, H, W, rows x Kx)
+        del color_distance_sq
+
+        kernel = kernel * space_kernel[..., start:start + rows, :].flatten(-2)
+        numerator += (unfolded_input * kernel).sum(-1)
+        denominator += kernel.sum(-1)
+
+    return numerator / denominator
+
+
 def bilateral_blur(
     input: Tensor,
     kernel_size: tuple[int, int] | int = (13, 13),
@@ -126,12 +184,21 @@ def bilateral_blur(
     return _bilateral_blur(input, None, kernel_size, sigma_color, sigma_space, border_type, color_distance_type)
 
 
-def adaptive_anisotropic_filter(x, g=None):
+def adaptive_anisotropic_filter(x, g=None, rows_per_chunk=13):
+    """rows_per_chunk below 13 bounds the memory of the 13 x 13 kernel to rows_per_chunk x 13 times the input."""
     if g is None:
         g = x
     s, m = torch.std_mean(g, dim=(1, 2, 3), keepdim=True)
     s = s + 1e-5
     guidance = (g - m) / s
+    if rows_per_chunk < 13:
+        return _bilateral_blur_chunked(x, guidance,
+                                       kernel_size=(13, 13),
+                                       sigma_color=3.0,
+                                       sigma_space=3.0,
+                                       border_type='reflect',
+                                       color_distance_type='l1',
+                                       rows_per_chunk=max(rows_per_chunk, 1))
     y = _bilateral_blur(x, guidance,
                         kernel_size=(13, 13),
                         sigma_color=3.0,
@@ -1,11 +1,16 @@
+import itertools
 import threading
 
-from extras.inpaint_mask import generate_mask_from_image, SAMOptions
+from extras.inpaint_mask import generate_mask_from_image, generate_masks_from_image, SAMOptions
 from modules.patch import PatchSettings, patch_settings, patch_all
+from modules.task_queue import TaskScheduler, YieldChannel, PRIORITY_INTERACTIVE
 import modules.config
+import args_manager
 
 patch_all()
 
+task_counter = itertools.count(1)
+
 
 class AsyncTask:
     def __init__(self, args):
@@ -15,13 +20,19 @@ class AsyncTask:
         import args_manager
 
         self.args = args.copy()
-        self.yields = []
+        self.yields = YieldChannel()
         self.results = []
         self.last_stop = False
         self.processing = False
 
         self.performance_loras = []
 
+        self.task_id = next(task_counter)
+        self.priority = PRIORITY_INTERACTIVE
+
+        # one prompt per image, shares a single model and LoRA refresh, see modules.batch_engine
+        self.batch_prompts = []
+
         if len(args) == 0:
             return
 
@@ -158,7 +169,37 @@ class AsyncTask:
         self.images_to_enhance_count = 0
         self.enhance_stats = {}
 
-async_tasks = []
+    def get_prompt_loras(self):
+        """The LoRAs the worker will load, including the <lora:name:weight> references of the first prompt."""
+        import modules.config
+        from modules.util import parse_lora_references_from_prompt, remove_performance_lora
+
+        prompt = self.batch_prompts[0] if len(self.batch_prompts) > 0 else (self.prompt.splitlines() or [''])[0]
+        lora_filenames = remove_performance_lora(modules.config.lora_filenames, self.performance_selection)
+        loras, _ = parse_lora_references_from_prompt(prompt, self.loras, modules.config.default_max_lora_number,
+                                                     lora_filenames=lora_filenames)
+        return loras
+
+async_tasks = TaskScheduler(max_skips=args_manager.args.scheduler_max_skips)
+
+
+def cancel_task(task_id):
+    """Cancel a task by id. A pending task is removed from the queue, a running task is stopped."""
+    task = async_tasks.cancel(task_id)
+    if task is not None:
+        task.last_stop = 'stop'
+        task.yields.append(['finish', task.results])
+        return True
+
+    task = async_tasks.running
+    if task is not None and task.task_id == task_id:
+        import ldm_patched.modules.model_management as model_management
+        task.last_stop = 'stop'
+        if task.processing:
+            model_management.interrupt_current_processing()
+        return True
+
+    return False
 
 
 class EarlyReturnException(BaseException):
@@ -175,9 +216,9 @@ def worker():
     import torch
     import time
     import shared
-    import random
     import copy
     import cv2
+    import args_manager
     import modules.default_pipeline as pipeline
     import modules.core as core
     import modules.flags as flags
@@ -185,18 +226,18 @@ def worker():
     import ldm_patched.modules.model_management
     import extras.preprocessors as preprocessors
     import modules.inpaint_worker as inpaint_worker
-    import modules.constants as constants
     import extras.ip_adapter as ip_adapter
     import extras.face_crop
     import fooocus_version
 
     from extras.censor import default_censor
-    from modules.sdxl_styles import apply_style, get_random_style, fooocus_expansion, apply_arrays, random_style_name
+    from modules.sdxl_styles import fooocus_expansion
+    from modules.prompt_plan import plan_prompts, get_unique_workloads, print_plan
     from modules.private_logger import log
+    import modules.private_logger
     from extras.expansion import safe_str
     from modules.util import (remove_empty_str, HWC3, resize_image, get_image_shape_ceil, set_image_shape_ceil,
-                              get_shape_ceil, resample_image, erode_or_dilate, parse_lora_references_from_prompt,
-                              apply_wildcards)
+                              get_shape_ceil, resample_image, erode_or_dilate, parse_lora_references_from_prompt)
     from modules.upscaler import perform_upscale
     from modules.flags import Performance
     from modules.meta_parser import get_metadata_parser
@@ -230,6 +271,7 @@ def worker():
         if do_not_show_finished_images:
             return
 
+        modules.private_logger.wait_for(imgs)
         async_task.yields.append(['results', async_task.results])
         return
 
@@ -308,7 +350,8 @@ def worker():
             tiled=tiled,
             cfg_scale=async_task.cfg_scale,
             refiner_swap_method=async_task.refiner_swap_method,
-            disable_preview=async_task.disable_preview
+            disable_preview=async_task.disable_preview,
+            preview_observed=async_task.yields.is_observed
         )
         del positive_cond, negative_cond  # Save memory
         if inpaint_worker.current_task is not None:
@@ -324,6 +367,59 @@ def worker():
 
         return imgs, img_paths, current_progress
 
+    def process_task_batch(all_steps, async_task, callback, current_task_id, final_scheduler_name, steps, switch,
+                           task_batch, loras, use_expansion, width, height, base_progress, preparation_steps,
+                           total_count, show_intermediate_results, persist_image=True):
+        if async_task.last_stop is not False:
+            ldm_patched.modules.model_management.interrupt_current_processing()
+        imgs = pipeline.process_diffusion(
+            positive_cond=pipeline.stack_conds([task['c'] for task in task_batch]),
+            negative_cond=pipeline.stack_conds([task['uc'] for task in task_batch]),
+            steps=steps,
+            switch=switch,
+            width=width,
+            height=height,
+            image_seed=[task['task_seed'] for task in task_batch],
+            callback=callback,
+            sampler_name=async_task.sampler_name,
+            scheduler_name=final_scheduler_name,
+            cfg_scale=async_task.cfg_scale,
+            refiner_swap_method=async_task.refiner_swap_method,
+            disable_preview=async_task.disable_preview,
+            preview_observed=async_task.yields.is_observed
+        )
+        current_progress = int(base_progress + (100 - preparation_steps) / float(all_steps) * steps * len(task_batch))
+        if modules.config.default_black_out_nsfw or async_task.black_out_nsfw:
+            progressbar(async_task, current_progress, 'Checking for NSFW content ...')
+            imgs = default_censor(imgs)
+        img_paths = []
+        for i, (img, task) in enumerate(zip(imgs, task_batch)):
+            progressbar(async_task, current_progress, f'Saving image {current_task_id + i + 1}/{total_count} to system ...')
+            img_paths += save_and_log(async_task, height, [img], task, use_expansion, width, loras, persist_image)
+        yield_result(async_task, img_paths, current_progress, async_task.black_out_nsfw, False,
+                     do_not_show_finished_images=not show_intermediate_results or async_task.disable_intermediate_results)
+
+        return imgs, img_paths, current_progress
+
+    def get_task_batches(async_task, tasks, goals):
+        batch_size = max(int(args_manager.args.batch_sampling_size), 1)
+        if batch_size == 1 or len(goals) > 0 or inpaint_worker.current_task is not None:
+            return [[task] for task in tasks]
+        if async_task.sampler_name not in flags.BATCH_SEED_SAMPLERS:
+            # ancestral and other samplers draw noise from the global generator, batches would change the images
+            print(f'[Batch Sampling] {async_task.sampler_name} is sampled one image at a time.')
+            return [[task] for task in tasks]
+
+        task_batches = []
+        for task in tasks:
+            if len(task_batches) > 0 and len(task_batches[-1]) < batch_size \
+                    and pipeline.can_stack_conds([t['c'] for t in task_batches[-1]] + [task['c']]) \
+                    and pipeline.can_stack_conds([t['uc'] for t in task_batches[-1]] + [task['uc']]):
+                task_batches[-1].append(task)
+            else:
+                task_batches.append([task])
+        return task_batches
+
     def apply_patch_settings(async_task):
         patch_settings[pid] = PatchSettings(
             async_task.sharpness,
@@ -639,12 +735,12 @@ def worker():
         return steps, switch, width, height
 
     def process_prompt(async_task, prompt, negative_prompt, base_model_additional_loras, image_number, disable_seed_increment, use_expansion, use_style,
-                       use_synthetic_refiner, current_progress, advance_progress=False):
+                       use_synthetic_refiner, current_progress, advance_progress=False, batch_prompts=None):
         prompts = remove_empty_str([safe_str(p) for p in prompt.splitlines()], default='')
         negative_prompts = remove_empty_str([safe_str(p) for p in negative_prompt.splitlines()], default='')
         prompt = prompts[0]
         negative_prompt = negative_prompts[0]
-        if prompt == '':
+        if prompt == '' and not batch_prompts:
             # disable expansion when empty since it is not meaningful and influences image prompt
             use_expansion = False
         extra_positive_prompts = prompts[1:] if len(prompts) > 1 else []
@@ -657,7 +753,25 @@ def worker():
         loras, prompt = parse_lora_references_from_prompt(prompt, async_task.loras,
                                                           modules.config.default_max_lora_number,
                                                           lora_filenames=lora_filenames)
+        image_prompts = [prompt] * image_number
+        if batch_prompts:
+            # all prompts of a batch share one model refresh, so the LoRAs of the first prompt are used for all
+            image_prompts = []
+            for i, batch_prompt in enumerate(batch_prompts):
+                batch_loras, batch_prompt = parse_lora_references_from_prompt(safe_str(batch_prompt), async_task.loras,
+                                                                              modules.config.default_max_lora_number,
+                                                                              lora_filenames=lora_filenames)
+                if i == 0:
+                    loras = batch_loras
+                elif batch_loras != loras:
+                    print(f'[Batch] LoRAs of prompt #{i + 1} differ from the first prompt and are ignored.')
+                image_prompts.append(batch_prompt)
         loras += async_task.performance_loras
+        # the whole plan is resolved and logged before any model is loaded
+        tasks = plan_prompts(image_prompts, negative_prompt, extra_positive_prompts, extra_negative_prompts,
+                             async_task.style_selections, async_task.seed, disable_seed_increment, use_style,
+                             async_task.read_wildcards_in_order, args_manager.args.verbose_prompt_plan)
+        print_plan(tasks, args_manager.args.verbose_prompt_plan)
         pipeline.refresh_everything(refiner_model_name=async_task.refiner_model_name,
                                     base_model_name=async_task.base_model_name,
                                     loras=loras, base_model_additional_loras=base_model_additional_loras,
@@ -666,92 +780,34 @@ def worker():
         if advance_progress:
             current_progress += 1
         progressbar(async_task, current_progress, 'Processing prompts ...')
-        tasks = []
-        for i in range(image_number):
-            if disable_seed_increment:
-                task_seed = async_task.seed % (constants.MAX_SEED + 1)
-            else:
-                task_seed = (async_task.seed + i) % (constants.MAX_SEED + 1)  # randint is inclusive, % is not
-
-            task_rng = random.Random(task_seed)  # may bind to inpaint noise in the future
-            task_prompt = apply_wildcards(prompt, task_rng, i, async_task.read_wildcards_in_order)
-            task_prompt = apply_arrays(task_prompt, i)
-            task_negative_prompt = apply_wildcards(negative_prompt, task_rng, i, async_task.read_wildcards_in_order)
-            task_extra_positive_prompts = [apply_wildcards(pmt, task_rng, i, async_task.read_wildcards_in_order) for pmt
-                                           in
-                                           extra_positive_prompts]
-            task_extra_negative_prompts = [apply_wildcards(pmt, task_rng, i, async_task.read_wildcards_in_order) for pmt
-                                           in
-                                           extra_negative_prompts]
-
-            positive_basic_workloads = []
-            negative_basic_workloads = []
-
-            task_styles = async_task.style_selections.copy()
-            if use_style:
-                placeholder_replaced = False
-
-                for j, s in enumerate(task_styles):
-                    if s == random_style_name:
-                        s = get_random_style(task_rng)
-                        task_styles[j] = s
-                    p, n, style_has_placeholder = apply_style(s, positive=task_prompt)
-                    if style_has_placeholder:
-                        placeholder_replaced = True
-                    positive_basic_workloads = positive_basic_workloads + p
-                    negative_basic_workloads = negative_basic_workloads + n
-
-                if not placeholder_replaced:
-                    positive_basic_workloads = [task_prompt] + positive_basic_workloads
-            else:
-                positive_basic_workloads.append(task_prompt)
-
-            negative_basic_workloads.append(task_negative_prompt)  # Always use independent workload for negative.
-
-            positive_basic_workloads = positive_basic_workloads + task_extra_positive_prompts
-            negative_basic_workloads = negative_basic_workloads + task_extra_negative_prompts
-
-            positive_basic_workloads = remove_empty_str(positive_basic_workloads, default=task_prompt)
-            negative_basic_workloads = remove_empty_str(negative_basic_workloads, default=task_negative_prompt)
-
-            tasks.append(dict(
-                task_seed=task_seed,
-                task_prompt=task_prompt,
-                task_negative_prompt=task_negative_prompt,
-                positive=positive_basic_workloads,
-                negative=negative_basic_workloads,
-                expansion='',
-                c=None,
-                uc=None,
-                positive_top_k=len(positive_basic_workloads),
-                negative_top_k=len(negative_basic_workloads),
-                log_positive_prompt='\n'.join([task_prompt] + task_extra_positive_prompts),
-                log_negative_prompt='\n'.join([task_negative_prompt] + task_extra_negative_prompts),
-                styles=task_styles
-            ))
         if use_expansion:
             if advance_progress:
                 current_progress += 1
-            for i, t in enumerate(tasks):
-
-                progressbar(async_task, current_progress, f'Preparing Fooocus text #{i + 1} ...')
-                expansion = pipeline.final_expansion(t['task_prompt'], t['task_seed'])
+            progressbar(async_task, current_progress, 'Preparing Fooocus text ...')
+            expansions = pipeline.final_expansion.expand_many([t['task_prompt'] for t in tasks],
+                                                              [t['task_seed'] for t in tasks])
+            for t, expansion in zip(tasks, expansions):
                 print(f'[Prompt Expansion] {expansion}')
                 t['expansion'] = expansion
                 t['positive'] = copy.deepcopy(t['positive']) + [expansion]  # Deep copy.
         if advance_progress:
             current_progress += 1
-        for i, t in enumerate(tasks):
-            progressbar(async_task, current_progress, f'Encoding positive #{i + 1} ...')
-            t['c'] = pipeline.clip_encode(texts=t['positive'], pool_top_k=t['positive_top_k'])
+        # identical workloads, e.g. from colliding wildcards or arrays, are only encoded once,
+        # the texts of all distinct workloads are encoded in one batch
+        unique_workloads = [('c', get_unique_workloads(tasks, 'positive'))]
+        if abs(float(async_task.cfg_scale) - 1.0) >= 1e-4:
+            unique_workloads.append(('uc', get_unique_workloads(tasks, 'negative')))
+        workloads = [(name, key, indices) for name, unique in unique_workloads for key, indices in unique.items()]
+        progressbar(async_task, current_progress, f'Encoding {len(workloads)} prompts ...')
+        conds = pipeline.clip_encode_workloads([(list(texts), pool_top_k) for _, (texts, pool_top_k), _ in workloads])
+        for (name, _, indices), cond in zip(workloads, conds):
+            for j, index in enumerate(indices):
+                tasks[index][name] = cond if j == 0 else pipeline.clone_cond(cond)
         if advance_progress:
             current_progress += 1
-        for i, t in enumerate(tasks):
-            if abs(float(async_task.cfg_scale) - 1.0) < 1e-4:
+        if abs(float(async_task.cfg_scale) - 1.0) < 1e-4:
+            for t in tasks:
                 t['uc'] = pipeline.clone_cond(t['c'])
-            else:
-                progressbar(async_task, current_progress, f'Encoding negative #{i + 1} ...')
-                t['uc'] = pipeline.clip_encode(texts=t['negative'], pool_top_k=t['negative_top_k'])
         return tasks, use_expansion, loras, current_progress
 
     def apply_freeu(async_task):
@@ -1085,6 +1141,10 @@ def worker():
 
         use_style = len(async_task.style_selections) > 0
 
+        if len(async_task.batch_prompts) > 0:
+            async_task.image_number = len(async_task.batch_prompts)
+            print(f'[Parameters] Batch prompts = {async_task.image_number}')
+
         if async_task.base_model_name == async_task.refiner_model_name:
             print(f'Refiner disabled because base model and refiner are same.')
             async_task.refiner_model_name = 'None'
@@ -1160,7 +1220,8 @@ def worker():
             tasks, use_expansion, loras, current_progress = process_prompt(async_task, async_task.prompt, async_task.negative_prompt,
                                                          base_model_additional_loras, async_task.image_number,
                                                          async_task.disable_seed_increment, use_expansion, use_style,
-                                                         use_synthetic_refiner, current_progress, advance_progress=True)
+                                                         use_synthetic_refiner, current_progress, advance_progress=True,
+                                                         batch_prompts=async_task.batch_prompts)
 
         if len(goals) > 0:
             current_progress += 1
@@ -1267,44 +1328,66 @@ def worker():
         preparation_steps = current_progress
         total_count = async_task.image_number
 
+        current_batch_size = 1
+
         def callback(step, x0, x, total_steps, y):
             if step == 0:
                 async_task.callback_steps = 0
-            async_task.callback_steps += (100 - preparation_steps) / float(all_steps)
+            async_tasks.step_done(async_task, step, current_batch_size)
+            async_task.callback_steps += (100 - preparation_steps) / float(all_steps) * current_batch_size
+            if current_batch_size > 1:
+                image_text = f'images {current_task_id + 1}-{current_task_id + current_batch_size}/{total_count}'
+            else:
+                image_text = f'image {current_task_id + 1}/{total_count}'
             async_task.yields.append(['preview', (
                 int(current_progress + async_task.callback_steps),
-                f'Sampling step {step + 1}/{total_steps}, image {current_task_id + 1}/{total_count} ...', y)])
+                f'Sampling step {step + 1}/{total_steps}, {image_text} ...', y)])
 
         show_intermediate_results = len(tasks) > 1 or async_task.should_enhance
         persist_image = not async_task.should_enhance or not async_task.save_final_enhanced_image_only
 
-        for current_task_id, task in enumerate(tasks):
+        current_task_id = 0
+        for task_batch in get_task_batches(async_task, tasks, goals):
+            current_batch_size = len(task_batch)
+            task = task_batch[0]
             progressbar(async_task, current_progress, f'Preparing task {current_task_id + 1}/{async_task.image_number} ...')
             execution_start_time = time.perf_counter()
 
             try:
-                imgs, img_paths, current_progress = process_task(all_steps, async_task, callback, controlnet_canny_path,
-                                                                 controlnet_cpds_path, current_task_id,
-                                                                 denoising_strength, final_scheduler_name, goals,
-                                                                 initial_latent, async_task.steps, switch, task['c'],
-                                                                 task['uc'], task, loras, tiled, use_expansion, width,
-                                                                 height, current_progress, preparation_steps,
-                                                                 async_task.image_number, show_intermediate_results,
-                                                                 persist_image)
-
-                current_progress = int(preparation_steps + (100 - preparation_steps) / float(all_steps) * async_task.steps * (current_task_id + 1))
+                if current_batch_size > 1:
+                    imgs, img_paths, current_progress = process_task_batch(all_steps, async_task, callback,
+                                                                           current_task_id, final_scheduler_name,
+                                                                           async_task.steps, switch, task_batch, loras,
+                                                                           use_expansion, width, height,
+                                                                           current_progress, preparation_steps,
+                                                                           async_task.image_number,
+                                                                           show_intermediate_results, persist_image)
+                else:
+                    imgs, img_paths, current_progress = process_task(all_steps, async_task, callback, controlnet_canny_path,
+                                                                     controlnet_cpds_path, current_task_id,
+                                                                     denoising_strength, final_scheduler_name, goals,
+                                                                     initial_latent, async_task.steps, switch, task['c'],
+                                                                     task['uc'], task, loras, tiled, use_expansion, width,
+                                                                     height, current_progress, preparation_steps,
+                                                                     async_task.image_number, show_intermediate_results,
+                                                                     persist_image)
+
+                current_progress = int(preparation_steps + (100 - preparation_steps) / float(all_steps) * async_task.steps * (current_task_id + current_batch_size))
                 images_to_enhance += imgs
 
             except ldm_patched.modules.model_management.InterruptProcessingException:
                 if async_task.last_stop == 'skip':
                     print('User skipped')
                     async_task.last_stop = False
+                    current_task_id += current_batch_size
                     continue
                 else:
                     print('User stopped')
                     break
 
-            del task['c'], task['uc']  # Save memory
+            for task in task_batch:
+                del task['c'], task['uc']  # Save memory
+            current_task_id += current_batch_size
             execution_time = time.perf_counter() - execution_start_time
             print(f'Generating and saving time: {execution_time:.2f} seconds')
 
@@ -1354,8 +1437,24 @@ def worker():
                 elif exception_result == 'break':
                     break
 
+            # detect the masks of all sam tabs on the image before it is inpainted by the first tab
+            batched_masks = {}
+            if args_manager.args.enhance_mask_batching:
+                sam_tabs = [i for i, x in enumerate(async_task.enhance_ctrls) if x[3] == 'sam']
+                if len(sam_tabs) > 1:
+                    progressbar(async_task, current_progress, f'Detecting {len(sam_tabs)} enhance masks ...')
+                    batched_masks = dict(zip(sam_tabs, generate_masks_from_image(img, [SAMOptions(
+                        dino_prompt=async_task.enhance_ctrls[i][0],
+                        dino_box_threshold=async_task.enhance_ctrls[i][7],
+                        dino_text_threshold=async_task.enhance_ctrls[i][6],
+                        dino_erode_or_dilate=async_task.dino_erode_or_dilate,
+                        dino_debug=async_task.debugging_dino,
+                        max_detections=async_task.enhance_ctrls[i][8],
+                        model_type=async_task.enhance_ctrls[i][5],
+                    ) for i in sam_tabs])))
+
             # inpaint for all other tabs
-            for enhance_mask_dino_prompt_text, enhance_prompt, enhance_negative_prompt, enhance_mask_model, enhance_mask_cloth_category, enhance_mask_sam_model, enhance_mask_text_threshold, enhance_mask_box_threshold, enhance_mask_sam_max_detections, enhance_inpaint_disable_initial_latent, enhance_inpaint_engine, enhance_inpaint_strength, enhance_inpaint_respective_field, enhance_inpaint_erode_or_dilate, enhance_mask_invert in async_task.enhance_ctrls:
+            for enhance_tab_index, (enhance_mask_dino_prompt_text, enhance_prompt, enhance_negative_prompt, enhance_mask_model, enhance_mask_cloth_category, enhance_mask_sam_model, enhance_mask_text_threshold, enhance_mask_box_threshold, enhance_mask_sam_max_detections, enhance_inpaint_disable_initial_latent, enhance_inpaint_engine, enhance_inpaint_strength, enhance_inpaint_respective_field, enhance_inpaint_erode_or_dilate, enhance_mask_invert) in enumerate(async_task.enhance_ctrls):
                 current_task_id += 1
                 current_progress = int(base_progress + (100 - preparation_steps) / float(all_steps) * (done_steps_upscaling + done_steps_inpainting))
                 progressbar(async_task, current_progress, f'Preparing enhancement {current_task_id + 1}/{total_count} ...')
@@ -1369,16 +1468,19 @@ def worker():
                 elif enhance_mask_model == 'u2net_cloth_seg':
                     extras['cloth_category'] = enhance_mask_cloth_category
 
-                mask, dino_detection_count, sam_detection_count, sam_detection_on_mask_count = generate_mask_from_image(
-                    img, mask_model=enhance_mask_model, extras=extras, sam_options=SAMOptions(
-                        dino_prompt=enhance_mask_dino_prompt_text,
-                        dino_box_threshold=enhance_mask_box_threshold,
-                        dino_text_threshold=enhance_mask_text_threshold,
-                        dino_erode_or_dilate=async_task.dino_erode_or_dilate,
-                        dino_debug=async_task.debugging_dino,
-                        max_detections=enhance_mask_sam_max_detections,
-                        model_type=enhance_mask_sam_model,
-                    ))
+                if enhance_tab_index in batched_masks:
+                    mask, dino_detection_count, sam_detection_count, sam_detection_on_mask_count = batched_masks[enhance_tab_index]
+                else:
+                    mask, dino_detection_count, sam_detection_count, sam_detection_on_mask_count = generate_mask_from_image(
+                        img, mask_model=enhance_mask_model, extras=extras, sam_options=SAMOptions(
+                            dino_prompt=enhance_mask_dino_prompt_text,
+                            dino_box_threshold=enhance_mask_box_threshold,
+                            dino_text_threshold=enhance_mask_text_threshold,
+                            dino_erode_or_dilate=async_task.dino_erode_or_dilate,
+                            dino_debug=async_task.debugging_dino,
+                            max_detections=enhance_mask_sam_max_detections,
+                            model_type=enhance_mask_sam_model,
+                        ))
                 if len(mask.shape) == 3:
                     mask = mask[:, :, 0]
 
@@ -1463,22 +1565,30 @@ def worker():
         return
 
     while True:
-        time.sleep(0.01)
-        if len(async_tasks) > 0:
-            task = async_tasks.pop(0)
-
-            try:
-                handler(task)
-                if task.generate_image_grid:
-                    build_image_wall(task)
-                task.yields.append(['finish', task.results])
-                pipeline.prepare_text_encoder(async_call=True)
-            except:
-                traceback.print_exc()
-                task.yields.append(['finish', task.results])
-            finally:
-                if pid in modules.patch.patch_settings:
-                    del modules.patch.patch_settings[pid]
+        task = async_tasks.get()
+
+        try:
+            handler(task)
+            modules.private_logger.flush()
+            if task.generate_image_grid:
+                build_image_wall(task)
+            task.yields.append(['finish', task.results])
+            pipeline.prepare_text_encoder(async_call=True)
+        except:
+            traceback.print_exc()
+            modules.private_logger.flush()
+            task.yields.append(['finish', task.results])
+        finally:
+            async_tasks.task_done(task)
+            if pid in modules.patch.patch_settings:
+                del modules.patch.patch_settings[pid]
+            if len(async_tasks) > 0 and async_tasks.seconds_per_step is not None:
+                queue_stats = async_tasks.stats()
+                print(f'[Scheduler] {queue_stats["pending"]} tasks pending '
+                      f'({queue_stats["pending_interactive"]} interactive, {queue_stats["pending_bulk"]} bulk), '
+                      f'{queue_stats["seconds_per_step"]:.2f} seconds per step and '
+                      f'{queue_stats["seconds_per_task"]:.2f} seconds overhead per task, '
+                      f'estimated {queue_stats["eta"]:.0f} seconds left, {queue_stats["model_swaps"]} model swaps')
     pass
 
 
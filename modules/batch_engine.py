@@ -0,0 +1,199 @@
+import random
+
+import args_manager
+import modules.config
+import modules.constants as constants
+import modules.flags as flags
+import modules.async_worker as worker
+
+from modules.task_queue import PRIORITY_BULK
+from modules.util import parse_lora_references_from_prompt
+
+
+def default_task_args(prompt='', seed=None, **overrides):
+    """
+    Build the flat argument list consumed by AsyncTask, in the same order as the web UI controls,
+    populated with the configured defaults. Any field can be replaced by passing it as keyword.
+    """
+    if seed is None:
+        seed = random.randint(constants.MIN_SEED, constants.MAX_SEED)
+
+    fields = [
+        ('generate_image_grid', False),
+        ('prompt', prompt),
+        ('negative_prompt', modules.config.default_prompt_negative),
+        ('style_selections', list(modules.config.default_styles)),
+        ('performance_selection', modules.config.default_performance),
+        ('aspect_ratios_selection', modules.config.default_aspect_ratio),
+        ('image_number', 1),
+        ('output_format', modules.config.default_output_format),
+        ('seed', seed),
+        ('read_wildcards_in_order', False),
+        ('sharpness', modules.config.default_sample_sharpness),
+        ('cfg_scale', modules.config.default_cfg_scale),
+        ('base_model_name', modules.config.default_base_model_name),
+        ('refiner_model_name', modules.config.default_refiner_model_name),
+        ('refiner_switch', modules.config.default_refiner_switch),
+        ('loras', modules.config.default_loras),
+        ('input_image_checkbox', False),
+        ('current_tab', 'uov'),
+        ('uov_method', modules.config.default_uov_method),
+        ('uov_input_image', None),
+        ('outpaint_selections', []),
+        ('inpaint_input_image', None),
+        ('inpaint_additional_prompt', ''),
+        ('inpaint_mask_image_upload', None),
+        ('disable_preview', True),
+        ('disable_intermediate_results', True),
+        ('disable_seed_increment', False),
+        ('black_out_nsfw', modules.config.default_black_out_nsfw),
+        ('adm_scaler_positive', 1.5),
+        ('adm_scaler_negative', 0.8),
+        ('adm_scaler_end', 0.3),
+        ('adaptive_cfg', modules.config.default_cfg_tsnr),
+        ('clip_skip', modules.config.default_clip_skip),
+        ('sampler_name', modules.config.default_sampler),
+        ('scheduler_name', modules.config.default_scheduler),
+        ('vae_name', modules.config.default_vae),
+        ('overwrite_step', modules.config.default_overwrite_step),
+        ('overwrite_switch', modules.config.default_overwrite_switch),
+        ('overwrite_width', -1),
+        ('overwrite_height', -1),
+        ('overwrite_vary_strength', -1),
+        ('overwrite_upscale_strength', modules.config.default_overwrite_upscale),
+        ('mixing_image_prompt_and_vary_upscale', False),
+        ('mixing_image_prompt_and_inpaint', False),
+        ('debugging_cn_preprocessor', False),
+        ('skipping_cn_preprocessor', False),
+        ('canny_low_threshold', 64),
+        ('canny_high_threshold', 128),
+        ('refiner_swap_method', flags.refiner_swap_method),
+        ('controlnet_softness', 0.25),
+        ('freeu_enabled', False),
+        ('freeu_b1', 1.01),
+        ('freeu_b2', 1.02),
+        ('freeu_s1', 0.99),
+        ('freeu_s2', 0.95),
+        ('debugging_inpaint_preprocessor', False),
+        ('inpaint_disable_initial_latent', False),
+        ('inpaint_engine', modules.config.default_inpaint_engine_version),
+        ('inpaint_strength', 1.0),
+        ('inpaint_respective_field', 0.618),
+        ('inpaint_advanced_masking_checkbox', modules.config.default_inpaint_advanced_masking_checkbox),
+        ('invert_mask_checkbox', modules.config.default_invert_mask_checkbox),
+        ('inpaint_erode_or_dilate', 0),
+        ('save_final_enhanced_image_only', modules.config.default_save_only_final_enhanced_image),
+        ('save_metadata_to_images', modules.config.default_save_metadata_to_images),
+        ('metadata_scheme', modules.config.default_metadata_scheme),
+        ('ip_ctrls', [(modules.config.default_ip_images[i], modules.config.default_ip_stop_ats[i],
+                       modules.config.default_ip_weights[i], modules.config.default_ip_types[i])
+                      for i in range(1, modules.config.default_controlnet_image_count + 1)]),
+        ('debugging_dino', False),
+        ('dino_erode_or_dilate', 0),
+        ('debugging_enhance_masks_checkbox', False),
+        ('enhance_input_image', None),
+        ('enhance_checkbox', False),
+        ('enhance_uov_method', modules.config.default_enhance_uov_method),
+        ('enhance_uov_processing_order', modules.config.default_enhance_uov_processing_order),
+        ('enhance_uov_prompt_type', modules.config.default_enhance_uov_prompt_type),
+        ('enhance_ctrls', [(False, '', '', '', modules.config.default_enhance_inpaint_mask_model,
+                            modules.config.default_inpaint_mask_cloth_category,
+                            modules.config.default_inpaint_mask_sam_model, 0.25, 0.3,
+                            modules.config.default_sam_max_detections, False,
+                            modules.config.default_inpaint_engine_version, 1.0, 0.618, 0, False)
+                           for _ in range(modules.config.default_enhance_tabs)]),
+    ]
+
+    names = [name for name, _ in fields]
+    for name in overrides:
+        assert name in names, f'Unknown task argument: {name}'
+
+    args = []
+    for name, value in fields:
+        value = overrides.get(name, value)
+
+        if name == 'save_final_enhanced_image_only' and args_manager.args.disable_image_log:
+            continue
+        if name in ['save_metadata_to_images', 'metadata_scheme'] and args_manager.args.disable_metadata:
+            continue
+
+        if name in ['loras', 'ip_ctrls', 'enhance_ctrls']:
+            for group in value:
+                args += list(group)
+        else:
+            args.append(value)
+
+    return args
+
+
+def create_task(prompt, seed=None, priority=PRIORITY_BULK, **overrides):
+    task = worker.AsyncTask(args=default_task_args(prompt, seed=seed, **overrides))
+    task.priority = priority
+    return task
+
+
+def wait_for_task(task, preview_callback=None):
+    """Consume the yields of a queued task until it finishes and return the list of result files."""
+    while True:
+        flag, product = task.yields.get()
+        if flag == 'preview' and preview_callback is not None:
+            preview_callback(*product)
+        if flag == 'finish':
+            return product
+
+
+def run_prompts(prompts, seed=None, preview_callback=None, **overrides):
+    """
+    Queue one fully populated AsyncTask per prompt so that the worker never idles between images,
+    then collect the results in order. With a fixed seed, prompt i uses seed + i.
+    """
+    tasks = []
+    for i, prompt in enumerate(prompts):
+        task_seed = None if seed is None else (seed + i) % (constants.MAX_SEED + 1)
+        task = create_task(prompt, seed=task_seed, **overrides)
+        tasks.append(task)
+        worker.async_tasks.append(task)
+
+    results = []
+    for prompt, task in zip(prompts, tasks):
+        results.append((prompt, wait_for_task(task, preview_callback=preview_callback)))
+    return results
+
+
+def group_prompts_by_loras(prompts):
+    """Split prompts into consecutive groups with identical inline LoRA references."""
+    groups = []
+    last_signature = None
+    for prompt in prompts:
+        loras, _ = parse_lora_references_from_prompt(prompt, [], modules.config.default_max_lora_number,
+                                                     lora_filenames=modules.config.lora_filenames)
+        signature = str(loras)
+        if len(groups) == 0 or signature != last_signature:
+            groups.append([])
+        groups[-1].append(prompt)
+        last_signature = signature
+    return groups
+
+
+def run_prompt_batch(prompts, seed=None, preview_callback=None, **overrides):
+    """
+    Generate one image per prompt with as few tasks as possible. Every task carries a list of prompts,
+    so models and LoRAs are only refreshed once per task. Prompt i uses seed + i like image_number does.
+    """
+    if seed is None:
+        seed = random.randint(constants.MIN_SEED, constants.MAX_SEED)
+
+    tasks = []
+    offset = 0
+    for group in group_prompts_by_loras(prompts):
+        task = create_task('', seed=(seed + offset) % (constants.MAX_SEED + 1), image_number=len(group),
+                           **overrides)
+        task.batch_prompts = group
+        tasks.append(task)
+        worker.async_tasks.append(task)
+        offset += len(group)
+
+    results = []
+    for task in tasks:
+        results += wait_for_task(task, preview_callback=preview_callback)
+    return results
@@ -0,0 +1,43 @@
+import hashlib
+import json
+import os
+
+import safetensors.torch
+
+import args_manager
+import modules.config
+from modules.disk_cache import DiskCache
+from modules.lru_cache import LRUCache
+
+memory_cache = LRUCache(max_bytes=args_manager.args.clip_cache_memory_size * 1024 * 1024)
+
+disk_cache = DiskCache(os.path.join(modules.config.path_cache, 'clip'),
+                       args_manager.args.clip_cache_disk_size * 1024 * 1024, '.safetensors', name='CLIP Cache')
+
+
+def get_key(signature, text):
+    return hashlib.sha256(json.dumps([signature, text]).encode('utf-8')).hexdigest()
+
+
+def load_disk_entry(path):
+    sd = safetensors.torch.load_file(path)
+    return sd['cond'], sd['pooled']
+
+
+def load(key):
+    result = memory_cache.get(key)
+    if result is not None:
+        return result
+
+    result = disk_cache.load(key, load_disk_entry)
+    if result is not None:
+        memory_cache.put(key, result)
+    return result
+
+
+def save(key, result):
+    memory_cache.put(key, result)
+
+    cond, pooled = result
+    disk_cache.save(key, lambda path: safetensors.torch.save_file(
+        {'cond': cond.cpu().contiguous(), 'pooled': pooled.cpu().contiguous()}, path))
@@ -1,4 +1,6 @@
 import os
+import threading
+import time
 import einops
 import torch
 import numpy as np
@@ -9,6 +11,8 @@ import ldm_patched.modules.model_patcher
 import ldm_patched.modules.utils
 import ldm_patched.modules.controlnet
 import modules.sample_hijack
+import modules.image_cache
+import args_manager
 import ldm_patched.modules.samplers
 import ldm_patched.modules.latent_formats
 
@@ -18,6 +22,9 @@ from ldm_patched.contrib.external import VAEDecode, EmptyLatentImage, VAEEncode,
 from ldm_patched.contrib.external_freelunch import FreeU_V2
 from ldm_patched.modules.sample import prepare_mask
 from modules.lora import match_lora
+from concurrent.futures import ThreadPoolExecutor
+from modules.lru_cache import LRUCache
+from modules.hash_cache import get_file_signature
 from modules.util import get_file_from_folder_list
 from ldm_patched.modules.lora import model_lora_keys_unet, model_lora_keys_clip
 from modules.config import path_embeddings
@@ -33,6 +40,9 @@ opFreeU = FreeU_V2()
 opModelSamplingDiscrete = ModelSamplingDiscrete()
 opModelSamplingContinuousEDM = ModelSamplingContinuousEDM()
 
+# matched LoRA patches, keyed by the LoRA file and the key maps of the model they were matched against
+lora_cache = LRUCache(max_bytes=args_manager.args.lora_cache_size * 1024 * 1024)
+
 
 class StableDiffusionModel:
     def __init__(self, unet=None, vae=None, clip=None, clip_vision=None, filename=None, vae_filename=None):
@@ -45,6 +55,7 @@ class StableDiffusionModel:
         self.unet_with_lora = unet
         self.clip_with_lora = clip
         self.visited_loras = ''
+        self.clip_loras = []
 
         self.lora_key_map_unet = {}
         self.lora_key_map_clip = {}
@@ -57,6 +68,24 @@ class StableDiffusionModel:
             self.lora_key_map_clip = model_lora_keys_clip(self.clip.cond_stage_model, self.lora_key_map_clip)
             self.lora_key_map_clip.update({x: x for x in self.clip.cond_stage_model.state_dict().keys()})
 
+        self.lora_key_map_signature = (hash(frozenset(self.lora_key_map_unet.items())),
+                                       hash(frozenset(self.lora_key_map_clip.items())))
+
+    def load_lora(self, lora_filename):
+        """Load and match a LoRA file, returns the UNet patches, the CLIP patches and the unmatched keys."""
+        key = (lora_filename, str(get_file_signature(lora_filename)), self.lora_key_map_signature)
+        result = lora_cache.get(key)
+        if result is not None:
+            return result
+
+        lora_unmatch = ldm_patched.modules.utils.load_torch_file(lora_filename, safe_load=False)
+        lora_unet, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_unet)
+        lora_clip, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_clip)
+
+        result = lora_unet, lora_clip, list(lora_unmatch.keys())
+        lora_cache.put(key, result)
+        return result
+
     @torch.no_grad()
     @torch.inference_mode()
     def refresh_loras(self, loras):
@@ -91,11 +120,10 @@ class StableDiffusionModel:
 
         self.unet_with_lora = self.unet.clone() if self.unet is not None else None
         self.clip_with_lora = self.clip.clone() if self.clip is not None else None
+        self.clip_loras = []
 
         for lora_filename, weight in loras_to_load:
-            lora_unmatch = ldm_patched.modules.utils.load_torch_file(lora_filename, safe_load=False)
-            lora_unet, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_unet)
-            lora_clip, lora_unmatch = match_lora(lora_unmatch, self.lora_key_map_clip)
+            lora_unet, lora_clip, lora_unmatch = self.load_lora(lora_filename)
 
             if len(lora_unmatch) > 12:
                 # model mismatch
@@ -103,7 +131,7 @@ class StableDiffusionModel:
 
             if len(lora_unmatch) > 0:
                 print(f'Loaded LoRA [{lora_filename}] for model [{self.filename}] '
-                      f'with unmatched keys {list(lora_unmatch.keys())}')
+                      f'with unmatched keys {lora_unmatch}')
 
             if self.unet_with_lora is not None and len(lora_unet) > 0:
                 loaded_keys = self.unet_with_lora.add_patches(lora_unet, weight)
@@ -115,6 +143,7 @@ class StableDiffusionModel:
 
             if self.clip_with_lora is not None and len(lora_clip) > 0:
                 loaded_keys = self.clip_with_lora.add_patches(lora_clip, weight)
+                self.clip_loras.append((lora_filename, weight))
                 print(f'Loaded LoRA [{lora_filename}] for CLIP [{self.filename}] '
                       f'with {len(loaded_keys)} keys at weight {weight}.')
                 for item in lora_clip:
@@ -146,6 +175,10 @@ def apply_controlnet(positive, negative, control_net, image, strength, start_per
 def load_model(ckpt_filename, vae_filename=None):
     unet, clip, vae, vae_filename, clip_vision = load_checkpoint_guess_config(ckpt_filename, embedding_directory=path_embeddings,
                                                                 vae_filename_param=vae_filename)
+    if vae is not None:
+        # identifies the VAE weights for the cache of encoded latents
+        vae_weights_filename = vae_filename if vae_filename is not None else ckpt_filename
+        vae.cache_signature = [vae_weights_filename, get_file_signature(vae_weights_filename)]
     return StableDiffusionModel(unet=unet, clip=clip, vae=vae, clip_vision=clip_vision, filename=ckpt_filename, vae_filename=vae_filename)
 
 
@@ -167,10 +200,21 @@ def decode_vae(vae, latent_image, tiled=False):
 @torch.no_grad()
 @torch.inference_mode()
 def encode_vae(vae, pixels, tiled=False):
+    key = None
+    if getattr(vae, 'cache_signature', None) is not None:
+        key = modules.image_cache.get_key(['encode_vae', vae.cache_signature, tiled], pixels)
+        samples = modules.image_cache.load(key)
+        if samples is not None:
+            return {'samples': torch.from_numpy(samples)}
+
     if tiled:
-        return opVAEEncodeTiled.encode(pixels=pixels, vae=vae, tile_size=512)[0]
+        result = opVAEEncodeTiled.encode(pixels=pixels, vae=vae, tile_size=512)[0]
     else:
-        return opVAEEncode.encode(pixels=pixels, vae=vae)[0]
+        result = opVAEEncode.encode(pixels=pixels, vae=vae)[0]
+
+    if key is not None:
+        modules.image_cache.save(key, result['samples'].cpu().numpy())
+    return result
 
 
 @torch.no_grad()
@@ -180,10 +224,22 @@ def encode_vae_inpaint(vae, pixels, mask):
     assert mask.shape[-1] == pixels.shape[-2]
     assert mask.shape[-2] == pixels.shape[-3]
 
-    w = mask.round()[..., None]
-    pixels = pixels * (1 - w) + 0.5 * w
+    key = None
+    latent = None
+    if getattr(vae, 'cache_signature', None) is not None:
+        key = modules.image_cache.get_key(['encode_vae_inpaint', vae.cache_signature], pixels, mask)
+        latent = modules.image_cache.load(key)
+
+    if latent is not None:
+        latent = torch.from_numpy(latent)
+    else:
+        w = mask.round()[..., None]
+        pixels = pixels * (1 - w) + 0.5 * w
+
+        latent = vae.encode(pixels)
+        if key is not None:
+            modules.image_cache.save(key, latent.cpu().numpy())
 
-    latent = vae.encode(pixels)
     B, C, H, W = latent.shape
 
     latent_mask = mask[:, None, :, :]
@@ -217,20 +273,15 @@ class VAEApprox(torch.nn.Module):
 
 
 VAE_approx_models = {}
+VAE_approx_lock = threading.Lock()
 
 
-@torch.no_grad()
-@torch.inference_mode()
-def get_previewer(model):
-    global VAE_approx_models
-
-    from modules.config import path_vae_approx
-    is_sdxl = isinstance(model.model.latent_format, ldm_patched.modules.latent_formats.SDXL)
-    vae_approx_filename = os.path.join(path_vae_approx, 'xlvaeapp.pth' if is_sdxl else 'vaeapp_sd15.pth')
+def load_vae_approx(vae_approx_filename):
+    # the preview thread keeps using the model it was given, models are only ever added under the lock
+    with VAE_approx_lock:
+        if vae_approx_filename in VAE_approx_models:
+            return VAE_approx_models[vae_approx_filename]
 
-    if vae_approx_filename in VAE_approx_models:
-        VAE_approx_model = VAE_approx_models[vae_approx_filename]
-    else:
         sd = torch.load(vae_approx_filename, map_location='cpu', weights_only=True)
         VAE_approx_model = VAEApprox()
         VAE_approx_model.load_state_dict(sd)
@@ -246,13 +297,23 @@ def get_previewer(model):
 
         VAE_approx_model.to(ldm_patched.modules.model_management.get_torch_device())
         VAE_approx_models[vae_approx_filename] = VAE_approx_model
+        return VAE_approx_model
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def get_previewer(model):
+    from modules.config import path_vae_approx
+    is_sdxl = isinstance(model.model.latent_format, ldm_patched.modules.latent_formats.SDXL)
+    vae_approx_filename = os.path.join(path_vae_approx, 'xlvaeapp.pth' if is_sdxl else 'vaeapp_sd15.pth')
+    vae_approx_model = load_vae_approx(vae_approx_filename)
 
     @torch.no_grad()
     @torch.inference_mode()
     def preview_function(x0, step, total_steps):
         with torch.no_grad():
-            x_sample = x0.to(VAE_approx_model.current_type)
-            x_sample = VAE_approx_model(x_sample) * 127.5 + 127.5
+            x_sample = x0[:1].to(vae_approx_model.current_type)
+            x_sample = vae_approx_model(x_sample) * 127.5 + 127.5
             x_sample = einops.rearrange(x_sample, 'b c h w -> b h w c')[0]
             x_sample = x_sample.cpu().numpy().clip(0, 255).astype(np.uint8)
             return x_sample
@@ -260,12 +321,87 @@ def get_previewer(model):
     return preview_function
 
 
+preview_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='preview')
+preview_stream = None
+
+
+class AsyncPreviewer:
+    """
+    Renders previews on the preview thread, on a side CUDA stream when available, so that sampling does not wait
+    for the approximate decode and the copy to the CPU. A frame that is still pending when the next one is
+    submitted is dropped, pop() returns the latest frame that has not been returned yet.
+    """
+
+    def __init__(self, previewer):
+        global preview_stream
+
+        self.previewer = previewer
+        self.lock = threading.Lock()
+        self.pending = None
+        self.result = None
+        self.running = False
+        self.dropped = 0
+
+        device = ldm_patched.modules.model_management.get_torch_device()
+        if device.type == 'cuda' and preview_stream is None:
+            preview_stream = torch.cuda.Stream(device=device)
+        self.stream = preview_stream if device.type == 'cuda' else None
+
+    def submit(self, x0, step, total_steps):
+        # the sampler may reuse the memory of x0 once the callback returns
+        x_sample = x0[:1].clone()
+        event = None
+        if self.stream is not None:
+            event = torch.cuda.Event()
+            event.record()
+
+        with self.lock:
+            if self.pending is not None:
+                self.dropped += 1
+            self.pending = (x_sample, event, step, total_steps)
+            if self.running:
+                return
+            self.running = True
+
+        preview_executor.submit(self.render)
+
+    def render(self):
+        while True:
+            with self.lock:
+                if self.pending is None:
+                    self.running = False
+                    return
+                x_sample, event, step, total_steps = self.pending
+                self.pending = None
+
+            try:
+                if self.stream is not None:
+                    with torch.cuda.stream(self.stream):
+                        self.stream.wait_event(event)
+                        x_sample.record_stream(self.stream)
+                        y = self.previewer(x_sample, step, total_steps)
+                else:
+                    y = self.previewer(x_sample, step, total_steps)
+            except Exception as e:
+                print(f'[Preview] Rendering failed: {e}')
+                y = None
+
+            with self.lock:
+                self.result = y
+
+    def pop(self):
+        with self.lock:
+            y, self.result = self.result, None
+        return y
+
+
 @torch.no_grad()
 @torch.inference_mode()
 def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sampler_name='dpmpp_2m_sde_gpu',
              scheduler='karras', denoise=1.0, disable_noise=False, start_step=None, last_step=None,
              force_full_denoise=False, callback_function=None, refiner=None, refiner_switch=-1,
-             previewer_start=None, previewer_end=None, sigmas=None, noise_mean=None, disable_preview=False):
+             previewer_start=None, previewer_end=None, sigmas=None, noise_mean=None, disable_preview=False,
+             preview_observed=None):
 
     if sigmas is not None:
         sigmas = sigmas.clone().to(ldm_patched.modules.model_management.get_torch_device())
@@ -276,7 +412,12 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
         noise = torch.zeros(latent_image.size(), dtype=latent_image.dtype, layout=latent_image.layout, device="cpu")
     else:
         batch_inds = latent["batch_index"] if "batch_index" in latent else None
-        noise = ldm_patched.modules.sample.prepare_noise(latent_image, seed, batch_inds)
+        if isinstance(seed, list):
+            # one seed per sample, so that every image of a batch matches the one sampled alone
+            noise = torch.cat([ldm_patched.modules.sample.prepare_noise(latent_image[i:i + 1], s)
+                               for i, s in enumerate(seed)])
+        else:
+            noise = ldm_patched.modules.sample.prepare_noise(latent_image, seed, batch_inds)
 
     if isinstance(noise_mean, torch.Tensor):
         noise = noise + noise_mean - torch.mean(noise, dim=1, keepdim=True)
@@ -293,11 +434,32 @@ def ksampler(model, positive, negative, latent, seed=None, steps=30, cfg=7.0, sa
     if previewer_end is None:
         previewer_end = steps
 
+    async_previewer = None
+    if previewer is not None and not disable_preview and not args_manager.args.disable_async_preview:
+        async_previewer = AsyncPreviewer(previewer)
+
+    preview_interval = max(args_manager.args.preview_interval, 1)
+    preview_min_seconds = 1.0 / args_manager.args.preview_max_fps if args_manager.args.preview_max_fps > 0 else 0.0
+    last_preview_step = None
+    last_preview_time = 0.0
+
     def callback(step, x0, x, total_steps):
+        nonlocal last_preview_step, last_preview_time
+
         ldm_patched.modules.model_management.throw_exception_if_processing_interrupted()
         y = None
-        if previewer is not None and not disable_preview:
-            y = previewer(x0, previewer_start + step, previewer_end)
+        if previewer is not None and not disable_preview \
+                and (last_preview_step is None or step - last_preview_step >= preview_interval) \
+                and time.perf_counter() - last_preview_time >= preview_min_seconds \
+                and (preview_observed is None or preview_observed()):
+            last_preview_step = step
+            last_preview_time = time.perf_counter()
+            if async_previewer is not None:
+                async_previewer.submit(x0, previewer_start + step, previewer_end)
+            else:
+                y = previewer(x0, previewer_start + step, previewer_end)
+        if async_previewer is not None:
+            y = async_previewer.pop()
         if callback_function is not None:
             callback_function(previewer_start + step, x0, x, previewer_end, y)
 
@@ -1,5 +1,6 @@
 import modules.core as core
 import os
+import math
 import torch
 import modules.patch
 import modules.config
@@ -7,17 +8,24 @@ import modules.flags
 import ldm_patched.modules.model_management
 import ldm_patched.modules.latent_formats
 import modules.inpaint_worker
+import modules.clip_cache
+import args_manager
 import extras.vae_interpose as vae_interpose
 from extras.expansion import FooocusExpansion
 
 from ldm_patched.modules.model_base import SDXL, SDXLRefiner
 from modules.sample_hijack import clip_separate
 from modules.util import get_file_from_folder_list, get_enabled_loras
+from modules.hash_cache import get_file_signature
+from modules.lru_cache import LRUCache
 
 
 model_base = core.StableDiffusionModel()
 model_refiner = core.StableDiffusionModel()
 
+# recently used base and refiner models kept in system RAM, the current ones included
+model_pool = LRUCache(max_items=max(args_manager.args.model_pool_size, 1))
+
 final_expansion = None
 final_unet = None
 final_clip = None
@@ -25,6 +33,9 @@ final_vae = None
 final_refiner_unet = None
 final_refiner_vae = None
 
+# base model, CLIP LoRAs and embeddings, the CLIP conditioning of a text also depends on the clip skip
+clip_cache_signature = None
+
 loaded_ControlNets = {}
 
 
@@ -71,7 +82,16 @@ def refresh_base_model(name, vae_name=None):
     if model_base.filename == filename and model_base.vae_filename == vae_filename:
         return
 
+    key = ('base', filename, vae_filename, str(get_file_signature(filename)))
+    model = model_pool.get(key)
+    if model is not None:
+        model_base = model
+        print(f'Base model reused from memory: {model_base.filename}')
+        print(f'VAE reused from memory: {model_base.vae_filename}')
+        return
+
     model_base = core.load_model(filename, vae_filename)
+    model_pool.put(key, model_base)
     print(f'Base model loaded: {model_base.filename}')
     print(f'VAE loaded: {model_base.vae_filename}')
     return
@@ -93,7 +113,15 @@ def refresh_refiner_model(name):
         print(f'Refiner unloaded.')
         return
 
+    key = ('refiner', filename, str(get_file_signature(filename)))
+    model = model_pool.get(key)
+    if model is not None:
+        model_refiner = model
+        print(f'Refiner model reused from memory: {model_refiner.filename}')
+        return
+
     model_refiner = core.load_model(filename)
+    model_pool.put(key, model_refiner)
     print(f'Refiner model loaded: {model_refiner.filename}')
 
     if isinstance(model_refiner.unet.model, SDXL):
@@ -144,18 +172,27 @@ def refresh_loras(loras, base_model_additional_loras=None):
 
 @torch.no_grad()
 @torch.inference_mode()
-def clip_encode_single(clip, text, verbose=False):
-    cached = clip.fcs_cond_cache.get(text, None)
-    if cached is not None:
-        if verbose:
+def clip_encode_many(clip, texts, verbose=False):
+    """Encode many texts with the CLIP cache, all texts missing from the cache are encoded in one batch."""
+    keys = [modules.clip_cache.get_key([clip_cache_signature, clip.layer_idx], text) for text in texts]
+    results = [modules.clip_cache.load(key) for key in keys]
+
+    missing = {}
+    for text, key, result in zip(texts, keys, results):
+        if result is None:
+            missing.setdefault(key, text)
+        elif verbose:
             print(f'[CLIP Cached] {text}')
-        return cached
-    tokens = clip.tokenize(text)
-    result = clip.encode_from_tokens(tokens, return_pooled=True)
-    clip.fcs_cond_cache[text] = result
-    if verbose:
-        print(f'[CLIP Encoded] {text}')
-    return result
+
+    if len(missing) > 0:
+        encoded = dict(zip(missing.keys(), clip.encode_from_tokens_many([clip.tokenize(text) for text in missing.values()])))
+        for key, result in encoded.items():
+            modules.clip_cache.save(key, result)
+            if verbose:
+                print(f'[CLIP Encoded] {missing[key]}')
+        results = [encoded[key] if result is None else result for key, result in zip(keys, results)]
+
+    return results
 
 
 @torch.no_grad()
@@ -189,16 +226,50 @@ def clip_encode(texts, pool_top_k=1):
     if len(texts) == 0:
         return None
 
-    cond_list = []
-    pooled_acc = 0
+    return clip_encode_workloads([(texts, pool_top_k)])[0]
 
-    for i, text in enumerate(texts):
-        cond, pooled = clip_encode_single(final_clip, text)
-        cond_list.append(cond)
-        if i < pool_top_k:
-            pooled_acc += pooled
 
-    return [[torch.cat(cond_list, dim=1), {"pooled_output": pooled_acc}]]
+@torch.no_grad()
+@torch.inference_mode()
+def clip_encode_workloads(workloads):
+    """
+    clip_encode for a list of (texts, pool_top_k) workloads, the texts of all workloads are encoded together.
+    """
+    if final_clip is None:
+        return [None] * len(workloads)
+
+    encoded = clip_encode_many(final_clip, [text for texts, _ in workloads for text in texts])
+
+    results = []
+    offset = 0
+    for texts, pool_top_k in workloads:
+        cond_list = []
+        pooled_acc = 0
+
+        for i, (cond, pooled) in enumerate(encoded[offset:offset + len(texts)]):
+            cond_list.append(cond)
+            if i < pool_top_k:
+                pooled_acc += pooled
+        offset += len(texts)
+
+        results.append([[torch.cat(cond_list, dim=1), {"pooled_output": pooled_acc}]] if len(texts) > 0 else None)
+
+    return results
+
+
+def can_stack_conds(conds, max_repeat=4):
+    lengths = [cond[0][0].shape[1] for cond in conds]
+    return math.lcm(*lengths) // min(lengths) <= max_repeat
+
+
+@torch.no_grad()
+@torch.inference_mode()
+def stack_conds(conds):
+    # shorter conds are repeated to a common length like CONDCrossAttn.concat, this does not change the result
+    max_len = math.lcm(*[cond[0][0].shape[1] for cond in conds])
+    c = [cond[0][0].repeat(1, max_len // cond[0][0].shape[1], 1) for cond in conds]
+    p = [cond[0][1]['pooled_output'] for cond in conds]
+    return [[torch.cat(c, dim=0), {'pooled_output': torch.cat(p, dim=0)}]]
 
 
 @torch.no_grad()
@@ -212,10 +283,23 @@ def set_clip_skip(clip_skip: int):
     final_clip.clip_layer(-abs(clip_skip))
     return
 
-@torch.no_grad()
-@torch.inference_mode()
-def clear_all_caches():
-    final_clip.fcs_cond_cache = {}
+
+def get_cache_file_identity(filepath):
+    return [filepath, get_file_signature(filepath)]
+
+
+def refresh_clip_cache_signature():
+    global clip_cache_signature
+
+    # keyed on file signatures only, keys must not change when a hash becomes available later in the session
+    embedding_filenames = modules.config.get_model_filenames(modules.config.path_embeddings,
+                                                              ['.safetensors', '.pt', '.bin'])
+    clip_cache_signature = dict(
+        model=get_cache_file_identity(model_base.filename),
+        loras=[(get_cache_file_identity(filename), weight) for filename, weight in model_base.clip_loras],
+        embeddings=[get_cache_file_identity(os.path.join(modules.config.path_embeddings, filename))
+                    for filename in embedding_filenames]
+    )
 
 
 @torch.no_grad()
@@ -263,7 +347,7 @@ def refresh_everything(refiner_model_name, base_model_name, loras,
         final_expansion = FooocusExpansion()
 
     prepare_text_encoder(async_call=True)
-    clear_all_caches()
+    refresh_clip_cache_signature()
     return
 
 
@@ -333,7 +417,7 @@ def get_candidate_vae(steps, switch, denoise=1.0, refiner_swap_method='joint'):
 
 @torch.no_grad()
 @torch.inference_mode()
-def process_diffusion(positive_cond, negative_cond, steps, switch, width, height, image_seed, callback, sampler_name, scheduler_name, latent=None, denoise=1.0, tiled=False, cfg_scale=7.0, refiner_swap_method='joint', disable_preview=False):
+def process_diffusion(positive_cond, negative_cond, steps, switch, width, height, image_seed, callback, sampler_name, scheduler_name, latent=None, denoise=1.0, tiled=False, cfg_scale=7.0, refiner_swap_method='joint', disable_preview=False, preview_observed=None):
     target_unet, target_vae, target_refiner_unet, target_refiner_vae, target_clip \
         = final_unet, final_vae, final_refiner_unet, final_refiner_vae, final_clip
 
@@ -358,8 +442,11 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
 
     print(f'[Sampler] refiner_swap_method = {refiner_swap_method}')
 
+    # a list of seeds samples one image per seed in a single batch
+    batch_size = len(image_seed) if isinstance(image_seed, list) else 1
+
     if latent is None:
-        initial_latent = core.generate_empty_latent(width=width, height=height, batch_size=1)
+        initial_latent = core.generate_empty_latent(width=width, height=height, batch_size=batch_size)
     else:
         initial_latent = latent
 
@@ -392,7 +479,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             refiner_switch=switch,
             previewer_start=0,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_observed=preview_observed
         )
         decoded_latent = core.decode_vae(vae=target_vae, latent_image=sampled_latent, tiled=tiled)
 
@@ -411,7 +499,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             scheduler=scheduler_name,
             previewer_start=0,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_observed=preview_observed
         )
         print('Refiner swapped by changing ksampler. Noise preserved.')
 
@@ -434,7 +523,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             scheduler=scheduler_name,
             previewer_start=switch,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_observed=preview_observed
         )
 
         target_model = target_refiner_vae
@@ -462,7 +552,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             scheduler=scheduler_name,
             previewer_start=0,
             previewer_end=steps,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_observed=preview_observed
         )
         print('Fooocus VAE-based swap.')
 
@@ -492,7 +583,7 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             negative=clip_separate(negative_cond, target_model=target_model.model, target_clip=target_clip),
             latent=sampled_latent,
             steps=len_sigmas, start_step=0, last_step=len_sigmas, disable_noise=False, force_full_denoise=True,
-            seed=image_seed+1,
+            seed=[s + 1 for s in image_seed] if isinstance(image_seed, list) else image_seed + 1,
             denoise=denoise,
             callback_function=callback,
             cfg=cfg_scale,
@@ -502,7 +593,8 @@ def process_diffusion(positive_cond, negative_cond, steps, switch, width, height
             previewer_end=steps,
             sigmas=sigmas,
             noise_mean=noise_mean,
-            disable_preview=disable_preview
+            disable_preview=disable_preview,
+            preview_observed=preview_observed
         )
 
         target_model = target_refiner_vae
@@ -0,0 +1,98 @@
+import os
+import threading
+
+
+class DiskCache:
+    """
+    One file per key below a directory, bounded by max_bytes. When the bound is exceeded the least recently
+    used files are removed until 90% of it is left. A max_bytes of 0 or less disables the cache.
+    """
+
+    def __init__(self, path, max_bytes, extension, name='Cache'):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.extension = extension
+        self.name = name
+        self.index = None
+        self.lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get_path(self, key):
+        return os.path.join(self.path, key[:2], f'{key}{self.extension}')
+
+    def load_index(self):
+        if self.index is not None:
+            return
+
+        self.index = {}
+        for root, _, files in os.walk(self.path):
+            for file in files:
+                if file.endswith(self.extension) and '.tmp' not in file:
+                    stat = os.stat(os.path.join(root, file))
+                    self.index[os.path.join(root, file)] = (stat.st_mtime, stat.st_size)
+
+    def update_index(self, path):
+        stat = os.stat(path)
+        self.index[path] = (stat.st_mtime, stat.st_size)
+
+    def evict(self):
+        total = sum(size for _, size in self.index.values())
+        if total <= self.max_bytes:
+            return
+
+        for path, (_, size) in sorted(self.index.items(), key=lambda x: x[1][0]):
+            if total <= self.max_bytes * 0.9:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            del self.index[path]
+            total -= size
+
+    def load(self, key, load_function):
+        """Returns load_function(path) for the file of the key and marks it as used, or None."""
+        if not self.enabled:
+            return None
+
+        path = self.get_path(key)
+        if not os.path.exists(path):
+            return None
+
+        try:
+            result = load_function(path)
+        except Exception as e:
+            print(f'[{self.name}] Loading failed: {e}')
+            return None
+
+        with self.lock:
+            try:
+                self.load_index()
+                os.utime(path)
+                self.update_index(path)
+            except OSError as e:
+                print(f'[{self.name}] Updating {path} failed: {e}')
+
+        return result
+
+    def save(self, key, save_function):
+        """Writes the file of the key with save_function(path), atomically replacing an existing one."""
+        if not self.enabled:
+            return
+
+        path = self.get_path(key)
+
+        with self.lock:
+            try:
+                self.load_index()
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                temp_path = f'{path}.tmp{self.extension}'
+                save_function(temp_path)
+                os.replace(temp_path, path)
+                self.update_index(path)
+                self.evict()
+            except Exception as e:
+                print(f'[{self.name}] Saving failed: {e}')
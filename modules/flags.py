@@ -53,6 +53,11 @@ SAMPLER_EXTRA = {
 
 SAMPLERS = KSAMPLER | SAMPLER_EXTRA
 
+# samplers that add no noise or draw it from the Brownian tree, which is seeded per sample,
+# so that sampling a batch of seeds gives the same images as sampling every seed alone
+BATCH_SEED_SAMPLERS = ["euler", "heun", "dpm_2", "lms", "dpmpp_2m", "dpmpp_sde", "dpmpp_sde_gpu", "dpmpp_2m_sde",
+                       "dpmpp_2m_sde_gpu", "dpmpp_3m_sde", "dpmpp_3m_sde_gpu", "ddim", "uni_pc", "uni_pc_bh2"]
+
 KSAMPLER_NAMES = list(KSAMPLER.keys())
 
 SCHEDULER_NAMES = ["normal", "karras", "exponential", "sgm_uniform", "simple", "ddim_uniform", "lcm", "turbo", "align_your_steps", "tcd", "edm_playground_v2.5"]
@@ -1,6 +1,7 @@
 import json
 import os
-from concurrent.futures import ThreadPoolExecutor
+import threading
+from concurrent.futures import ThreadPoolExecutor, Future
 from multiprocessing import cpu_count
 
 import args_manager
@@ -8,18 +9,83 @@ from modules.util import sha256, HASH_SHA256_LENGTH, get_file_from_folder_list
 
 hash_cache_filename = 'hash_cache.txt'
 hash_cache = {}
+hash_cache_lock = threading.Lock()
+pending_hashes = {}
+hash_executor = None
+
+
+def get_file_signature(filepath):
+    """Size, modification time and inode of a file, a cached hash is only valid while these are unchanged."""
+    stat = os.stat(filepath)
+    return dict(size=stat.st_size, mtime_ns=stat.st_mtime_ns, inode=stat.st_ino)
+
+
+def is_valid_entry(entry, signature):
+    return all(entry.get(key) == value for key, value in signature.items())
 
 
 def sha256_from_cache(filepath):
-    global hash_cache
-    if filepath not in hash_cache:
+    signature = get_file_signature(filepath)
+
+    with hash_cache_lock:
+        entry = hash_cache.get(filepath)
+        if entry is not None and is_valid_entry(entry, signature):
+            return entry['hash']
+
+        # another thread is hashing this file already, wait for its result instead of reading the file twice
+        future = pending_hashes.get(filepath)
+        owner = future is None
+        if owner:
+            future = Future()
+            pending_hashes[filepath] = future
+
+    if not owner:
+        return future.result()
+
+    try:
+        if entry is not None:
+            print(f"[Cache] {filepath} has changed since it was hashed")
         print(f"[Cache] Calculating sha256 for {filepath}")
         hash_value = sha256(filepath)
         print(f"[Cache] sha256 for {filepath}: {hash_value}")
-        hash_cache[filepath] = hash_value
-        save_cache_to_file(filepath, hash_value)
+        entry = dict(hash=hash_value, **signature)
+        with hash_cache_lock:
+            hash_cache[filepath] = entry
+            save_cache_to_file(filepath, entry)
+        future.set_result(hash_value)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with hash_cache_lock:
+            pending_hashes.pop(filepath, None)
+
+    return hash_value
+
+
+def sha256_future(filepath):
+    """
+    Future of the hash of a file that never blocks the caller. It is done already if the hash is cached,
+    shared with the thread that is hashing the file, or otherwise computed in a background thread.
+    """
+    global hash_executor
 
-    return hash_cache[filepath]
+    signature = get_file_signature(filepath)
+
+    with hash_cache_lock:
+        entry = hash_cache.get(filepath)
+        if entry is not None and is_valid_entry(entry, signature):
+            future = Future()
+            future.set_result(entry['hash'])
+            return future
+
+        future = pending_hashes.get(filepath)
+        if future is not None:
+            return future
+
+        if hash_executor is None:
+            hash_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='hash')
+    return hash_executor.submit(sha256_from_cache, filepath)
 
 
 def load_cache_from_file():
@@ -30,20 +96,24 @@ def load_cache_from_file():
             with open(hash_cache_filename, 'rt', encoding='utf-8') as fp:
                 for line in fp:
                     entry = json.loads(line)
-                    for filepath, hash_value in entry.items():
-                        if not os.path.exists(filepath) or not isinstance(hash_value, str) and len(hash_value) != HASH_SHA256_LENGTH:
+                    for filepath, value in entry.items():
+                        if isinstance(value, str):
+                            # entries written before file signatures were stored are assumed to match the file
+                            value = dict(hash=value, **get_file_signature(filepath)) if os.path.exists(filepath) else {}
+                        hash_value = value.get('hash')
+                        if not os.path.exists(filepath) or not isinstance(hash_value, str) or len(hash_value) != HASH_SHA256_LENGTH:
                             print(f'[Cache] Skipping invalid cache entry: {filepath}')
                             continue
-                        hash_cache[filepath] = hash_value
+                        hash_cache[filepath] = value
     except Exception as e:
         print(f'[Cache] Loading failed: {e}')
 
 
-def save_cache_to_file(filename=None, hash_value=None):
+def save_cache_to_file(filename=None, entry=None):
     global hash_cache
 
-    if filename is not None and hash_value is not None:
-        items = [(filename, hash_value)]
+    if filename is not None and entry is not None:
+        items = [(filename, entry)]
         mode = 'at'
     else:
         items = sorted(hash_cache.items())
@@ -51,8 +121,8 @@ def save_cache_to_file(filename=None, hash_value=None):
 
     try:
         with open(hash_cache_filename, mode, encoding='utf-8') as fp:
-            for filepath, hash_value in items:
-                json.dump({filepath: hash_value}, fp)
+            for filepath, entry in items:
+                json.dump({filepath: entry}, fp)
                 fp.write('\n')
     except Exception as e:
         print(f'[Cache] Saving failed: {e}')
@@ -66,13 +136,22 @@ def init_cache(model_filenames, paths_checkpoints, lora_filenames, paths_loras):
         rebuild_cache(lora_filenames, model_filenames, paths_checkpoints, paths_loras, max_workers)
 
     # write cache to file again for sorting and cleanup of invalid cache entries
-    save_cache_to_file()
+    with hash_cache_lock:
+        save_cache_to_file()
+
+    if not args_manager.args.rebuild_hash_cache and args_manager.args.background_hash_workers > 0:
+        threading.Thread(target=rebuild_cache, daemon=True,
+                         args=(lora_filenames, model_filenames, paths_checkpoints, paths_loras,
+                               args_manager.args.background_hash_workers)).start()
 
 
 def rebuild_cache(lora_filenames, model_filenames, paths_checkpoints, paths_loras, max_workers=cpu_count()):
     def thread(filename, paths):
-        filepath = get_file_from_folder_list(filename, paths)
-        sha256_from_cache(filepath)
+        try:
+            filepath = get_file_from_folder_list(filename, paths)
+            sha256_from_cache(filepath)
+        except Exception as e:
+            print(f'[Cache] Hashing {filename} failed: {e}')
 
     print('[Cache] Rebuilding hash cache')
     with ThreadPoolExecutor(max_workers=max_workers) as executor:
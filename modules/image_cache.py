@@ -0,0 +1,49 @@
+import hashlib
+import json
+import os
+
+import numpy as np
+
+import args_manager
+import modules.config
+from modules.disk_cache import DiskCache
+from modules.lru_cache import LRUCache
+
+memory_cache = LRUCache(max_bytes=args_manager.args.image_cache_memory_size * 1024 * 1024)
+
+disk_cache = DiskCache(os.path.join(modules.config.path_cache, 'images'),
+                       args_manager.args.image_cache_disk_size * 1024 * 1024, '.npz', name='Image Cache')
+
+
+def get_key(signature, *arrays):
+    """Digest of the signature and the content of the arrays, which may be numpy arrays or tensors."""
+    hash_sha256 = hashlib.sha256(json.dumps(signature).encode('utf-8'))
+    for array in arrays:
+        if hasattr(array, 'cpu'):
+            array = array.cpu().numpy()
+        array = np.ascontiguousarray(array)
+        hash_sha256.update(f'{array.shape}{array.dtype.str}'.encode('utf-8'))
+        hash_sha256.update(array.data)
+    return hash_sha256.hexdigest()
+
+
+def load_disk_entry(path):
+    with np.load(path) as data:
+        return data['array']
+
+
+def load(key):
+    """Returns a copy of the cached array, or None."""
+    result = memory_cache.get(key)
+    if result is None:
+        result = disk_cache.load(key, load_disk_entry)
+        if result is None:
+            return None
+        memory_cache.put(key, result)
+    return result.copy()
+
+
+def save(key, array):
+    array = np.array(array)
+    memory_cache.put(key, array)
+    disk_cache.save(key, lambda path: np.savez_compressed(path, array=array))
@@ -36,18 +36,13 @@ def max_filter_opencv(x, ksize=3):
 
 
 def morphological_open(x):
-    # Convert array to int16 type via threshold operation
-    x_int16 = np.zeros_like(x, dtype=np.int16)
-    x_int16[x > 127] = 256
+    if x.ndim == 3:
+        return np.stack([morphological_open(x[:, :, i]) for i in range(x.shape[2])], axis=2)
 
-    for i in range(32):
-        # Use int16 type to avoid overflow
-        maxed = max_filter_opencv(x_int16, ksize=3) - 8
-        x_int16 = np.maximum(maxed, x_int16)
-
-    # Clip negative values to 0 and convert back to uint8 type
-    x_uint8 = np.clip(x_int16, 0, 255).astype(np.uint8)
-    return x_uint8
+    # Same result as 32 steps of a 3x3 max filter that loses 8 per step, starting from 256 inside the mask:
+    # every pixel is 256 minus 8 times its chessboard distance to the mask.
+    distance = cv2.distanceTransform((x <= 127).astype(np.uint8), cv2.DIST_C, cv2.DIST_MASK_3)
+    return np.clip(256.0 - 8.0 * distance, 0, 255).astype(np.uint8)
 
 
 def up255(x, t=0):
@@ -134,15 +129,16 @@ def solve_abcd(x, a, b, c, d, k):
 
 
 def fooocus_fill(image, mask):
+    # cv2.blur costs the same for any kernel size, blur between two buffers and copy the known pixels back in place
     current_image = image.copy()
-    raw_image = image.copy()
-    area = np.where(mask < 127)
-    store = raw_image[area]
+    blurred_image = np.empty_like(current_image)
+    area = (mask < 127).astype(np.uint8)
 
     for k, repeats in [(512, 2), (256, 2), (128, 4), (64, 4), (33, 8), (15, 8), (5, 16), (3, 16)]:
         for _ in range(repeats):
-            current_image = box_blur(current_image, k)
-            current_image[area] = store
+            cv2.blur(current_image, (2 * k + 1, 2 * k + 1), dst=blurred_image, borderType=cv2.BORDER_REPLICATE)
+            current_image, blurred_image = blurred_image, current_image
+            cv2.copyTo(image, area, dst=current_image)
 
     return current_image
 
@@ -0,0 +1,89 @@
+import threading
+from collections import OrderedDict
+
+
+def sizeof(value):
+    """Approximate memory size in bytes of tensors, arrays and strings, also inside lists, tuples and dicts."""
+    if isinstance(value, (list, tuple)):
+        return sum(sizeof(x) for x in value)
+    if isinstance(value, dict):
+        return sum(sizeof(x) for x in value.values())
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if hasattr(value, 'element_size') and hasattr(value, 'nelement'):
+        return value.element_size() * value.nelement()
+    if hasattr(value, 'nbytes'):
+        return int(value.nbytes)
+    return 0
+
+
+class LRUCache:
+    """Thread-safe least recently used cache, bounded by number of items and/or total size in bytes."""
+
+    def __init__(self, max_items=None, max_bytes=None, size_function=sizeof):
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self.size_function = size_function
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                self.misses += 1
+                return default
+            self.hits += 1
+            self.entries.move_to_end(key)
+            return self.entries[key][0]
+
+    def put(self, key, value):
+        size = self.size_function(value)
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            if self.max_bytes is not None and size > self.max_bytes:
+                return False
+            self.entries[key] = (value, size)
+            self.total_bytes += size
+            self.evict()
+            return True
+
+    def items(self):
+        """(key, value) pairs from least to most recently used."""
+        with self.lock:
+            return [(key, value) for key, (value, _) in self.entries.items()]
+
+    def pop(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            value, size = self.entries.pop(key)
+            self.total_bytes -= size
+            return value
+
+    def evict(self):
+        while len(self.entries) > 0:
+            too_many = self.max_items is not None and len(self.entries) > self.max_items
+            too_large = self.max_bytes is not None and self.total_bytes > self.max_bytes
+            if not too_many and not too_large:
+                break
+            _, (_, size) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def stats(self):
+        return dict(items=len(self.entries), bytes=self.total_bytes, hits=self.hits, misses=self.misses)
@@ -1,6 +1,7 @@
 import json
 import re
 from abc import ABC, abstractmethod
+from concurrent.futures import Future
 from pathlib import Path
 
 import gradio as gr
@@ -11,7 +12,7 @@ import modules.config
 import modules.sdxl_styles
 from modules.flags import MetadataScheme, Performance, Steps
 from modules.flags import SAMPLERS, CIVITAI_NO_KARRAS
-from modules.hash_cache import sha256_from_cache
+from modules.hash_cache import sha256_future
 from modules.util import quote, unquote, extract_styles_from_prompt, is_json, get_file_from_folder_list
 
 re_param_code = r'\s*(\w[\w \-/]+):\s*("(?:\\.|[^\\"])+"|[^,]*)(?:,|$)'
@@ -312,21 +313,33 @@ class MetadataParser(ABC):
         self.base_model_name = Path(base_model_name).stem
 
         base_model_path = get_file_from_folder_list(base_model_name, modules.config.paths_checkpoints)
-        self.base_model_hash = sha256_from_cache(base_model_path)
+        self.base_model_hash = sha256_future(base_model_path)
 
         if refiner_model_name not in ['', 'None']:
             self.refiner_model_name = Path(refiner_model_name).stem
             refiner_model_path = get_file_from_folder_list(refiner_model_name, modules.config.paths_checkpoints)
-            self.refiner_model_hash = sha256_from_cache(refiner_model_path)
+            self.refiner_model_hash = sha256_future(refiner_model_path)
 
         self.loras = []
         for (lora_name, lora_weight) in loras:
             if lora_name != 'None':
                 lora_path = get_file_from_folder_list(lora_name, modules.config.paths_loras)
-                lora_hash = sha256_from_cache(lora_path)
+                lora_hash = sha256_future(lora_path)
                 self.loras.append((Path(lora_name).stem, lora_weight, lora_hash))
         self.vae_name = Path(vae_name).stem
 
+    def resolve_hashes(self):
+        """
+        set_data only starts hashing the models and LoRAs that are not hashed yet, this waits for the hashes.
+        Call it before the metadata is serialised, on the thread that saves the image.
+        """
+        if isinstance(self.base_model_hash, Future):
+            self.base_model_hash = self.base_model_hash.result()
+        if isinstance(self.refiner_model_hash, Future):
+            self.refiner_model_hash = self.refiner_model_hash.result()
+        self.loras = [(name, weight, lora_hash.result() if isinstance(lora_hash, Future) else lora_hash)
+                      for name, weight, lora_hash in self.loras]
+
 
 class A1111MetadataParser(MetadataParser):
     def get_scheme(self) -> MetadataScheme:
@@ -223,6 +223,9 @@ def compute_cfg(uncond, cond, cfg_scale, t):
         return real_eps
 
 
+sharpness_alpha_threshold = 1e-5
+
+
 def patched_sampling_function(model, x, timestep, uncond, cond, cond_scale, model_options=None, seed=None):
     pid = os.getpid()
 
@@ -241,8 +244,14 @@ def patched_sampling_function(model, x, timestep, uncond, cond, cond_scale, mode
 
     alpha = 0.001 * patch_settings[pid].sharpness * patch_settings[pid].global_diffusion_progress
 
-    positive_eps_degraded = anisotropic.adaptive_anisotropic_filter(x=positive_eps, g=positive_x0)
-    positive_eps_degraded_weighted = positive_eps_degraded * alpha + positive_eps * (1.0 - alpha)
+    if alpha < sharpness_alpha_threshold:
+        # the filtered eps would only contribute below the precision of the latent
+        positive_eps_degraded_weighted = positive_eps
+    else:
+        positive_eps_degraded = anisotropic.adaptive_anisotropic_filter(
+            x=positive_eps, g=positive_x0,
+            rows_per_chunk=ldm_patched.modules.args_parser.args.sharpness_filter_chunk_rows)
+        positive_eps_degraded_weighted = positive_eps_degraded * alpha + positive_eps * (1.0 - alpha)
 
     final_eps = compute_cfg(uncond=negative_eps, cond=positive_eps_degraded_weighted,
                             cfg_scale=cond_scale, t=patch_settings[pid].global_diffusion_progress)
@@ -498,6 +507,8 @@ def patch_all():
 
     ldm_patched.modules.model_management.load_models_gpu = patched_load_models_gpu
     ldm_patched.modules.model_patcher.ModelPatcher.calculate_weight = calculate_weight_patched
+    ldm_patched.modules.model_patcher.ModelPatcher.incremental_weight_patching = \
+        ldm_patched.modules.args_parser.args.incremental_weight_patching
     ldm_patched.controlnet.cldm.ControlNet.forward = patched_cldm_forward
     ldm_patched.ldm.modules.diffusionmodules.openaimodel.UNetModel.forward = patched_unet_forward
     ldm_patched.modules.model_base.SDXL.encode_adm = sdxl_encode_adm_patched
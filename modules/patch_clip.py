@@ -15,6 +15,7 @@ import ldm_patched.modules.model_patcher
 import ldm_patched.modules.samplers
 import ldm_patched.modules.sd
 import ldm_patched.modules.sd1_clip
+import ldm_patched.modules.sdxl_clip
 import ldm_patched.modules.clip_vision
 import ldm_patched.modules.ops as ops
 
@@ -23,43 +24,104 @@ from transformers import CLIPTextModel, CLIPTextConfig, modeling_utils, CLIPVisi
 
 
 def patched_encode_token_weights(self, token_weight_pairs):
-    to_encode = list()
-    max_token_len = 0
-    has_weights = False
-    for x in token_weight_pairs:
-        tokens = list(map(lambda a: a[0], x))
-        max_token_len = max(len(tokens), max_token_len)
-        has_weights = has_weights or not all(map(lambda a: a[1] == 1.0, x))
-        to_encode.append(tokens)
-
-    sections = len(to_encode)
-    if has_weights or sections == 0:
-        to_encode.append(ldm_patched.modules.sd1_clip.gen_empty_tokens(self.special_tokens, max_token_len))
-
-    out, pooled = self.encode(to_encode)
-    if pooled is not None:
-        first_pooled = pooled[0:1].to(ldm_patched.modules.model_management.intermediate_device())
+    return patched_encode_token_weights_many(self, [token_weight_pairs])[0]
+
+
+def patched_encode_token_weights_many(self, token_weight_pairs_list, max_batch_size=32):
+    """
+    encode_token_weights for many prompts at once. The sections of all prompts, and the empty sections needed
+    for their weights, are encoded in one forward per token length of up to max_batch_size sections.
+    """
+    rows = []
+    empty_rows = {}
+    prompts = []
+    for token_weight_pairs in token_weight_pairs_list:
+        to_encode = list()
+        max_token_len = 0
+        has_weights = False
+        for x in token_weight_pairs:
+            tokens = list(map(lambda a: a[0], x))
+            max_token_len = max(len(tokens), max_token_len)
+            has_weights = has_weights or not all(map(lambda a: a[1] == 1.0, x))
+            to_encode.append(tokens)
+
+        sections = list(range(len(rows), len(rows) + len(to_encode)))
+        rows += to_encode
+
+        empty_row = None
+        if has_weights or len(sections) == 0:
+            if max_token_len not in empty_rows:
+                empty_rows[max_token_len] = len(rows)
+                rows.append(ldm_patched.modules.sd1_clip.gen_empty_tokens(self.special_tokens, max_token_len))
+            empty_row = empty_rows[max_token_len]
+
+        prompts.append((token_weight_pairs, sections, has_weights, empty_row))
+
+    buckets = {}
+    for i, tokens in enumerate(rows):
+        buckets.setdefault(len(tokens), []).append(i)
+
+    outs = [None] * len(rows)
+    pooleds = [None] * len(rows)
+    for bucket in buckets.values():
+        for start in range(0, len(bucket), max_batch_size):
+            batch = bucket[start:start + max_batch_size]
+            out, pooled = self.encode([rows[i] for i in batch])
+            for j, i in enumerate(batch):
+                outs[i] = out[j:j + 1]
+                pooleds[i] = pooled[j:j + 1] if pooled is not None else None
+
+    results = []
+    for token_weight_pairs, sections, has_weights, empty_row in prompts:
+        first_pooled = pooleds[sections[0] if len(sections) > 0 else empty_row]
+        if first_pooled is not None:
+            first_pooled = first_pooled.to(ldm_patched.modules.model_management.intermediate_device())
+
+        output = []
+        for k, row in enumerate(sections):
+            z = outs[row]
+            if has_weights:
+                z = z.clone()
+                original_mean = z.mean()
+                z_empty = outs[empty_row][0]
+                for i in range(len(z)):
+                    for j in range(len(z[i])):
+                        weight = token_weight_pairs[k][j][1]
+                        if weight != 1.0:
+                            z[i][j] = (z[i][j] - z_empty[j]) * weight + z_empty[j]
+                new_mean = z.mean()
+                z = z * (original_mean / new_mean)
+            output.append(z)
+
+        if len(output) == 0:
+            results.append((outs[empty_row].to(ldm_patched.modules.model_management.intermediate_device()), first_pooled))
+        else:
+            results.append((torch.cat(output, dim=-2).to(ldm_patched.modules.model_management.intermediate_device()), first_pooled))
+
+    return results
+
+
+def patched_SD1ClipModel_encode_token_weights_many(self, token_weight_pairs_list):
+    return getattr(self, self.clip).encode_token_weights_many([x[self.clip_name] for x in token_weight_pairs_list])
+
+
+def patched_SDXLClipModel_encode_token_weights_many(self, token_weight_pairs_list):
+    g_results = self.clip_g.encode_token_weights_many([x["g"] for x in token_weight_pairs_list])
+    l_results = self.clip_l.encode_token_weights_many([x["l"] for x in token_weight_pairs_list])
+    return [(torch.cat([l_out, g_out], dim=-1), g_pooled) for (g_out, g_pooled), (l_out, _) in zip(g_results, l_results)]
+
+
+def patched_CLIP_encode_from_tokens_many(self, tokens_list):
+    """encode_from_tokens(tokens, return_pooled=True) for a list of tokenized prompts, batched where supported."""
+    if self.layer_idx is not None:
+        self.cond_stage_model.clip_layer(self.layer_idx)
     else:
-        first_pooled = pooled
-
-    output = []
-    for k in range(0, sections):
-        z = out[k:k + 1]
-        if has_weights:
-            original_mean = z.mean()
-            z_empty = out[-1]
-            for i in range(len(z)):
-                for j in range(len(z[i])):
-                    weight = token_weight_pairs[k][j][1]
-                    if weight != 1.0:
-                        z[i][j] = (z[i][j] - z_empty[j]) * weight + z_empty[j]
-            new_mean = z.mean()
-            z = z * (original_mean / new_mean)
-        output.append(z)
-
-    if len(output) == 0:
-        return out[-1:].to(ldm_patched.modules.model_management.intermediate_device()), first_pooled
-    return torch.cat(output, dim=-2).to(ldm_patched.modules.model_management.intermediate_device()), first_pooled
+        self.cond_stage_model.reset_clip_layer()
+
+    self.load_model()
+    if not hasattr(self.cond_stage_model, 'encode_token_weights_many'):
+        return [self.cond_stage_model.encode_token_weights(tokens) for tokens in tokens_list]
+    return self.cond_stage_model.encode_token_weights_many(tokens_list)
 
 
 def patched_SDClipModel__init__(self, max_length=77, freeze=True, layer="last", layer_idx=None,
@@ -188,6 +250,10 @@ def patched_ClipVisionModel_encode_image(self, image):
 
 def patch_all_clip():
     ldm_patched.modules.sd1_clip.ClipTokenWeightEncoder.encode_token_weights = patched_encode_token_weights
+    ldm_patched.modules.sd1_clip.ClipTokenWeightEncoder.encode_token_weights_many = patched_encode_token_weights_many
+    ldm_patched.modules.sd1_clip.SD1ClipModel.encode_token_weights_many = patched_SD1ClipModel_encode_token_weights_many
+    ldm_patched.modules.sdxl_clip.SDXLClipModel.encode_token_weights_many = patched_SDXLClipModel_encode_token_weights_many
+    ldm_patched.modules.sd.CLIP.encode_from_tokens_many = patched_CLIP_encode_from_tokens_many
     ldm_patched.modules.sd1_clip.SDClipModel.__init__ = patched_SDClipModel__init__
     ldm_patched.modules.sd1_clip.SDClipModel.forward = patched_SDClipModel_forward
     ldm_patched.modules.clip_vision.ClipVisionModel.__init__ = patched_ClipVisionModel__init__
@@ -2,8 +2,12 @@ import os
 import args_manager
 import modules.config
 import json
+import re
+import threading
+import traceback
 import urllib.parse
 
+from concurrent.futures import ThreadPoolExecutor
 from PIL import Image
 from PIL.PngImagePlugin import PngInfo
 from modules.flags import OutputFormat
@@ -11,6 +15,20 @@ from modules.meta_parser import MetadataParser, get_exif
 from modules.util import generate_temp_filename
 
 log_cache = {}
+log_append_marker = '<!--fooocus-log-append-->'
+log_end_part = '</div></body></html>\n'
+log_lock = threading.Lock()
+
+# images are encoded and logged in the background, the semaphore bounds the number of queued images
+log_executor = None
+log_slots = None
+pending_logs = {}
+pending_logs_lock = threading.Lock()
+
+# html log entries are written in the order log() was called, an entry waits for the images logged before it
+log_sequence = 0
+next_log_sequence = 0
+html_log_entries = {}
 
 
 def get_current_html_path(output_format=None):
@@ -22,11 +40,94 @@ def get_current_html_path(output_format=None):
 
 
 def log(img, metadata, metadata_parser: MetadataParser | None = None, output_format=None, task=None, persist_image=True) -> str:
+    """
+    Save the image with its metadata and add it to the private log. With --image-save-workers > 0 this only
+    reserves the filename and queues the work, use wait_for() or flush() before reading the file.
+    """
+    global log_executor, log_slots, log_sequence
+
     path_outputs = modules.config.temp_path if args_manager.args.disable_image_log or not persist_image else modules.config.path_outputs
     output_format = output_format if output_format else modules.config.default_output_format
     date_string, local_temp_filename, only_name = generate_temp_filename(folder=path_outputs, extension=output_format)
     os.makedirs(os.path.dirname(local_temp_filename), exist_ok=True)
 
+    with pending_logs_lock:
+        sequence = log_sequence
+        log_sequence += 1
+
+    workers = args_manager.args.image_save_workers
+    if workers <= 0:
+        write_image_and_log(img, metadata, metadata_parser, output_format, task, date_string, local_temp_filename,
+                            only_name, sequence)
+        return local_temp_filename
+
+    if log_executor is None:
+        log_executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='image_log')
+        log_slots = threading.BoundedSemaphore(workers * 4)
+
+    if task is not None and 'positive' in task and 'negative' in task:
+        task = dict(positive=list(task['positive']), negative=list(task['negative']))
+
+    log_slots.acquire()
+    future = log_executor.submit(write_image_and_log, img.copy(), list(metadata), metadata_parser, output_format,
+                                 task, date_string, local_temp_filename, only_name, sequence)
+    with pending_logs_lock:
+        pending_logs[local_temp_filename] = future
+    future.add_done_callback(lambda f: finish_log(local_temp_filename, f))
+    return local_temp_filename
+
+
+def finish_log(filename, future):
+    log_slots.release()
+    with pending_logs_lock:
+        pending_logs.pop(filename, None)
+    if future.exception() is not None:
+        traceback.print_exception(future.exception())
+
+
+def wait_for(filenames):
+    """Wait until the given files, as returned by log(), are written."""
+    with pending_logs_lock:
+        futures = [pending_logs[f] for f in filenames if isinstance(f, str) and f in pending_logs]
+    for future in futures:
+        future.exception()
+
+
+def flush():
+    """Wait until all queued images are written."""
+    with pending_logs_lock:
+        futures = list(pending_logs.values())
+    for future in futures:
+        future.exception()
+
+
+def write_image_and_log(img, metadata, metadata_parser, output_format, task, date_string, local_temp_filename,
+                        only_name, sequence):
+    entry = None
+    try:
+        write_image(img, metadata, metadata_parser, output_format, local_temp_filename)
+        if not args_manager.args.disable_image_log:
+            entry = (metadata, task, date_string, local_temp_filename, only_name)
+    finally:
+        write_html_logs(sequence, entry)
+
+
+def write_html_logs(sequence, entry):
+    """Add the html log entry of an image, None if there is none, and write the entries that are next in order."""
+    global next_log_sequence
+
+    with log_lock:
+        html_log_entries[sequence] = entry
+        while next_log_sequence in html_log_entries:
+            entry = html_log_entries.pop(next_log_sequence)
+            next_log_sequence += 1
+            if entry is not None:
+                write_html_log(*entry)
+
+
+def write_image(img, metadata, metadata_parser, output_format, local_temp_filename):
+    if metadata_parser is not None:
+        metadata_parser.resolve_hashes()
     parsed_parameters = metadata_parser.to_string(metadata.copy()) if metadata_parser is not None else ''
     image = Image.fromarray(img)
 
@@ -45,9 +146,8 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
     else:
         image.save(local_temp_filename)
 
-    if args_manager.args.disable_image_log:
-        return local_temp_filename
 
+def write_html_log(metadata, task, date_string, local_temp_filename, only_name):
     html_name = os.path.join(os.path.dirname(local_temp_filename), 'log.html')
 
     css_styles = (
@@ -61,6 +161,7 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
         ".image-container img { height: auto; max-width: 512px; display: block; padding-right:10px; } "
         ".image-container div { text-align: center; padding: 4px; } "
         "hr { border-color: gray; } "
+        "#fooocus-log { display: flex; flex-direction: column-reverse; } "
         "button { background-color: black; color: white; border: 1px solid grey; border-radius: 5px; padding: 5px 10px; text-align: center; display: inline-block; font-size: 16px; cursor: pointer; }"
         "button:hover {background-color: grey; color: black;}"
         "</style>"
@@ -91,18 +192,13 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
         </script>"""
     )
 
-    begin_part = f"<!DOCTYPE html><html><head><title>Fooocus Log {date_string}</title>{css_styles}</head><body>{js}<p>Fooocus Log {date_string} (private)</p>\n<p>Metadata is embedded if enabled in the config or developer debug mode. You can find the information for each image in line Metadata Scheme.</p><!--fooocus-log-split-->\n\n"
-    end_part = f'\n<!--fooocus-log-split--></body></html>'
-
-    middle_part = log_cache.get(html_name, "")
+    # New entries are written over the closing tags at the end of the file, which are written again after them.
+    # The reversed flex column shows the newest image first.
+    begin_part = f"<!DOCTYPE html><html><head><title>Fooocus Log {date_string}</title>{css_styles}</head><body>{js}<p>Fooocus Log {date_string} (private)</p>\n<p>Metadata is embedded if enabled in the config or developer debug mode. You can find the information for each image in line Metadata Scheme.</p>{log_append_marker}<div id=\"fooocus-log\">\n\n"
 
-    if middle_part == "":
-        if os.path.exists(html_name):
-            existing_split = open(html_name, 'r', encoding='utf-8').read().split('<!--fooocus-log-split-->')
-            if len(existing_split) == 3:
-                middle_part = existing_split[1]
-            else:
-                middle_part = existing_split[0]
+    if html_name not in log_cache:
+        migrate_html_log(html_name, begin_part)
+        log_cache[html_name] = True
 
     div_name = only_name.replace('.', '_')
     item = f"<div id=\"{div_name}\" class=\"image-container\"><hr><table><tr>\n"
@@ -125,13 +221,38 @@ def log(img, metadata, metadata_parser: MetadataParser | None = None, output_for
     item += "</td>"
     item += "</tr></table></div>\n\n"
 
-    middle_part = item + middle_part
+    end = log_end_part.encode('utf-8')
+    with open(html_name, 'ab+') as f:
+        if f.tell() == 0:
+            f.write(begin_part.encode('utf-8'))
 
-    with open(html_name, 'w', encoding='utf-8') as f:
-        f.write(begin_part + middle_part + end_part)
+    with open(html_name, 'rb+') as f:
+        size = f.seek(0, os.SEEK_END)
+        if size >= len(end):
+            f.seek(size - len(end))
+            if f.read(len(end)) == end:
+                f.seek(size - len(end))
+        f.write(item.encode('utf-8') + end)
 
     print(f'Image generated with private log at: {html_name}')
 
-    log_cache[html_name] = middle_part
 
-    return local_temp_filename
+def migrate_html_log(html_name, begin_part):
+    """Convert a log written by older versions, which keeps the newest image first, to the append-only format."""
+    if not os.path.exists(html_name):
+        return
+
+    with open(html_name, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    if log_append_marker in content:
+        return
+
+    existing_split = content.split('<!--fooocus-log-split-->')
+    middle_part = existing_split[1] if len(existing_split) == 3 else existing_split[0]
+    items = [x for x in re.split(r'(?=<div id=")', middle_part) if x.startswith('<div id="')]
+
+    with open(html_name, 'w', encoding='utf-8') as f:
+        f.write(begin_part + ''.join(reversed(items)) + log_end_part)
+
+    print(f'[Private Log] Converted {html_name} to the append-only format.')
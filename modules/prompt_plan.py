@@ -0,0 +1,111 @@
+import random
+
+import modules.constants as constants
+from modules.sdxl_styles import apply_style, get_random_style, apply_arrays_many, random_style_name
+from modules.util import remove_empty_str, apply_wildcards
+
+
+def plan_prompts(image_prompts, negative_prompt, extra_positive_prompts, extra_negative_prompts, style_selections,
+                 seed, disable_seed_increment, use_style, read_wildcards_in_order, verbose=False):
+    """
+    Resolve the wildcards, [[arrays]] and styles of all images of a task before any model work.
+    Returns one task dict per image with its seed and final positive and negative workloads.
+    verbose prints every wildcard and array replacement.
+    """
+    seeds = []
+    rngs = []
+    task_prompts = []
+    task_negative_prompts = []
+    task_extra_positive_prompts = []
+    task_extra_negative_prompts = []
+
+    for i, image_prompt in enumerate(image_prompts):
+        if disable_seed_increment:
+            task_seed = seed % (constants.MAX_SEED + 1)
+        else:
+            task_seed = (seed + i) % (constants.MAX_SEED + 1)  # randint is inclusive, % is not
+
+        task_rng = random.Random(task_seed)  # may bind to inpaint noise in the future
+        seeds.append(task_seed)
+        rngs.append(task_rng)
+        task_prompts.append(apply_wildcards(image_prompt, task_rng, i, read_wildcards_in_order, verbose))
+        task_negative_prompts.append(apply_wildcards(negative_prompt, task_rng, i, read_wildcards_in_order, verbose))
+        task_extra_positive_prompts.append([apply_wildcards(pmt, task_rng, i, read_wildcards_in_order, verbose)
+                                            for pmt in extra_positive_prompts])
+        task_extra_negative_prompts.append([apply_wildcards(pmt, task_rng, i, read_wildcards_in_order, verbose)
+                                            for pmt in extra_negative_prompts])
+
+    task_prompts = apply_arrays_many(task_prompts, range(len(task_prompts)), verbose)
+
+    tasks = []
+    for i, task_prompt in enumerate(task_prompts):
+        task_negative_prompt = task_negative_prompts[i]
+        positive_basic_workloads = []
+        negative_basic_workloads = []
+
+        task_styles = style_selections.copy()
+        if use_style:
+            placeholder_replaced = False
+
+            for j, s in enumerate(task_styles):
+                if s == random_style_name:
+                    s = get_random_style(rngs[i])
+                    task_styles[j] = s
+                p, n, style_has_placeholder = apply_style(s, positive=task_prompt)
+                if style_has_placeholder:
+                    placeholder_replaced = True
+                positive_basic_workloads = positive_basic_workloads + p
+                negative_basic_workloads = negative_basic_workloads + n
+
+            if not placeholder_replaced:
+                positive_basic_workloads = [task_prompt] + positive_basic_workloads
+        else:
+            positive_basic_workloads.append(task_prompt)
+
+        negative_basic_workloads.append(task_negative_prompt)  # Always use independent workload for negative.
+
+        positive_basic_workloads = positive_basic_workloads + task_extra_positive_prompts[i]
+        negative_basic_workloads = negative_basic_workloads + task_extra_negative_prompts[i]
+
+        positive_basic_workloads = remove_empty_str(positive_basic_workloads, default=task_prompt)
+        negative_basic_workloads = remove_empty_str(negative_basic_workloads, default=task_negative_prompt)
+
+        tasks.append(dict(
+            task_seed=seeds[i],
+            task_prompt=task_prompt,
+            task_negative_prompt=task_negative_prompt,
+            positive=positive_basic_workloads,
+            negative=negative_basic_workloads,
+            expansion='',
+            c=None,
+            uc=None,
+            positive_top_k=len(positive_basic_workloads),
+            negative_top_k=len(negative_basic_workloads),
+            log_positive_prompt='\n'.join([task_prompt] + task_extra_positive_prompts[i]),
+            log_negative_prompt='\n'.join([task_negative_prompt] + task_extra_negative_prompts[i]),
+            styles=task_styles
+        ))
+    return tasks
+
+
+def get_unique_workloads(tasks, name):
+    """
+    Map every distinct (texts, pool_top_k) workload of the tasks to the indices of the tasks using it,
+    name is 'positive' or 'negative'.
+    """
+    workloads = {}
+    for i, t in enumerate(tasks):
+        workloads.setdefault((tuple(t[name]), t[f'{name}_top_k']), []).append(i)
+    return workloads
+
+
+def print_plan(tasks, verbose=False):
+    """Print a summary of the plan, verbose adds the seed and workloads of every image."""
+    unique_positive = len(get_unique_workloads(tasks, 'positive'))
+    unique_negative = len(get_unique_workloads(tasks, 'negative'))
+    print(f'[Prompt Plan] {len(tasks)} images, {unique_positive} distinct positive and '
+          f'{unique_negative} distinct negative workloads')
+    if not verbose:
+        return
+    for i, t in enumerate(tasks):
+        print(f'[Prompt Plan] #{i + 1} seed {t["task_seed"]}: {t["positive"]} | {t["negative"]}')
@@ -95,3 +95,25 @@ def apply_arrays(text, index):
     
     return text
 
+
+def apply_arrays_many(texts, indices, verbose=True):
+    """apply_arrays for many texts at once, each distinct text is only parsed once."""
+    parsed = {}
+    results = []
+    for text, index in zip(texts, indices):
+        if text not in parsed:
+            arrays = re.findall(r'\[\[(.*?)\]\]', text)
+            if len(arrays) > 0 and verbose:
+                print(f'[Arrays] processing: {text}')
+            parsed[text] = (arrays, math.prod(len(arr.split(',')) for arr in arrays))
+
+        arrays, mult = parsed[text]
+        if len(arrays) == 0:
+            results.append(text)
+            continue
+
+        chosen_words = get_words(arrays, mult, index % mult)
+        for arr, word in zip(arrays, chosen_words):
+            text = text.replace(f'[[{arr}]]', word, 1)
+        results.append(text)
+    return results
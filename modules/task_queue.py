@@ -0,0 +1,239 @@
+import copy
+import threading
+import time
+from collections import deque
+
+
+class YieldChannel:
+    """
+    Thread-safe channel for the ['flag', product] items a task yields to the UI.
+    Consumers block in get() instead of polling. A preview that has not been consumed yet
+    is replaced by the next one, so slow consumers only ever see the latest progress.
+    The channel is observed while a consumer waits in get() or has called it recently.
+    """
+
+    def __init__(self):
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.coalesced = 0
+        self.waiting = 0
+        self.last_get_time = None
+
+    def __len__(self):
+        with self.condition:
+            return len(self.items)
+
+    def __deepcopy__(self, memo):
+        # gradio deep copies the initial value of gr.State, locks cannot be copied
+        channel = YieldChannel()
+        with self.condition:
+            channel.items = copy.deepcopy(self.items, memo)
+        return channel
+
+    def append(self, item):
+        with self.condition:
+            if item[0] == 'preview' and len(self.items) > 0 and self.items[-1][0] == 'preview':
+                self.items[-1] = item
+                self.coalesced += 1
+            else:
+                self.items.append(item)
+            self.condition.notify_all()
+
+    def get(self, timeout=None):
+        """Return the next item, waiting for it if necessary. Returns None if the timeout expires."""
+        with self.condition:
+            self.waiting += 1
+            try:
+                if not self.condition.wait_for(lambda: len(self.items) > 0, timeout=timeout):
+                    return None
+                return self.items.popleft()
+            finally:
+                self.waiting -= 1
+                self.last_get_time = time.monotonic()
+
+    def is_observed(self, timeout=5.0):
+        """Whether a consumer is waiting for items or took one within the last timeout seconds."""
+        with self.condition:
+            if self.waiting > 0:
+                return True
+            return self.last_get_time is not None and time.monotonic() - self.last_get_time < timeout
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BULK = 1
+
+
+class TaskScheduler:
+    """
+    Thread-safe queue of pending tasks. The worker blocks in get() until a task is appended.
+    Tasks with a lower priority value are started first, tasks of equal priority in submission order.
+    Pending tasks can be cancelled by id. The seconds per sampling step, timed between the sampling
+    callbacks, and the remaining fixed overhead per task are used to estimate when queued tasks finish.
+
+    Among tasks of the same priority, tasks using the models and LoRAs that are loaded already are
+    started first, so that interleaved jobs do not reload checkpoints each time. A task is passed over
+    at most max_skips times, 0 disables the reordering.
+    """
+
+    def __init__(self, max_skips=0):
+        self.max_skips = max_skips
+        self.last_signature = None
+        self.model_swaps = 0
+        self.tasks = []
+        self.condition = threading.Condition()
+        self.sequence = 0
+        self.running = None
+        self.running_start_time = None
+        self.running_step_time = None
+        self.running_sampling_seconds = 0.0
+        self.running_sampled_steps = 0
+        self.seconds_per_step = None
+        self.seconds_per_task = None
+        self.completed = 0
+        self.cancelled = 0
+
+    def __len__(self):
+        with self.condition:
+            return len(self.tasks)
+
+    @staticmethod
+    def get_priority(task):
+        return getattr(task, 'priority', PRIORITY_INTERACTIVE)
+
+    @staticmethod
+    def get_steps(task):
+        return max(getattr(task, 'steps', 0) * getattr(task, 'image_number', 1), 1)
+
+    @staticmethod
+    def get_model_signature(task):
+        loras = task.get_prompt_loras() if hasattr(task, 'get_prompt_loras') else getattr(task, 'loras', None)
+        return str([getattr(task, name, None) for name in
+                    ['base_model_name', 'refiner_model_name', 'vae_name', 'performance_selection']] + [loras])
+
+    def append(self, task):
+        with self.condition:
+            self.sequence += 1
+            task.queue_sequence = self.sequence
+            task.queue_skips = 0
+            self.tasks.append(task)
+            self.condition.notify_all()
+
+    def next_index(self):
+        candidates = self.ordered_tasks()
+        candidates = [x for x in candidates if self.get_priority(x) == self.get_priority(candidates[0])]
+        task = candidates[0]
+
+        if self.max_skips > 0 and self.last_signature is not None:
+            for x in candidates:
+                if x.queue_skips >= self.max_skips or self.get_model_signature(x) == self.last_signature:
+                    task = x
+                    break
+
+        for x in candidates:
+            if x is task:
+                break
+            x.queue_skips += 1
+
+        return self.tasks.index(task)
+
+    def get(self, timeout=None):
+        """Remove and return the next task, waiting for it if necessary. Returns None if the timeout expires."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: len(self.tasks) > 0, timeout=timeout):
+                return None
+            task = self.tasks.pop(self.next_index())
+            signature = self.get_model_signature(task)
+            if self.last_signature is not None and signature != self.last_signature:
+                self.model_swaps += 1
+            self.last_signature = signature
+            self.running = task
+            self.running_start_time = time.perf_counter()
+            self.running_step_time = None
+            self.running_sampling_seconds = 0.0
+            self.running_sampled_steps = 0
+            return task
+
+    def step_done(self, task, step, images=1):
+        """
+        Called by the sampling callback of the running task after each step, step 0 starts a new sampling run.
+        A step of a batch samples several images at once, the time is counted for each of them.
+        """
+        with self.condition:
+            if task is not self.running:
+                return
+            now = time.perf_counter()
+            if step > 0 and self.running_step_time is not None:
+                self.running_sampling_seconds += now - self.running_step_time
+                self.running_sampled_steps += images
+            self.running_step_time = now
+
+    @staticmethod
+    def moving_average(average, value):
+        return value if average is None else 0.8 * average + 0.2 * value
+
+    def task_done(self, task):
+        """
+        Called by the worker when a task returned by get() is finished, updates the measured step time
+        and the overhead of the task that is not spent in sampling steps.
+        """
+        with self.condition:
+            if task is not self.running:
+                return
+            if self.running_sampled_steps > 0:
+                self.seconds_per_step = self.moving_average(
+                    self.seconds_per_step, self.running_sampling_seconds / self.running_sampled_steps)
+            if self.seconds_per_step is not None:
+                seconds = time.perf_counter() - self.running_start_time
+                overhead = max(seconds - self.get_steps(task) * self.seconds_per_step, 0.0)
+                self.seconds_per_task = self.moving_average(self.seconds_per_task, overhead)
+            self.running = None
+            self.running_start_time = None
+            self.running_step_time = None
+            self.completed += 1
+
+    def estimate(self, task):
+        return (self.seconds_per_task or 0.0) + self.get_steps(task) * self.seconds_per_step
+
+    def cancel(self, task_id):
+        """Remove a pending task. Returns the task, or None if no pending task has this id."""
+        with self.condition:
+            for i, task in enumerate(self.tasks):
+                if getattr(task, 'task_id', None) == task_id:
+                    self.cancelled += 1
+                    return self.tasks.pop(i)
+            return None
+
+    def ordered_tasks(self):
+        return sorted(self.tasks, key=lambda x: (self.get_priority(x), x.queue_sequence))
+
+    def stats(self):
+        """Queue depth per priority and the estimated seconds until each pending task is finished."""
+        with self.condition:
+            eta = None
+            pending = []
+
+            if self.seconds_per_step is not None:
+                eta = 0.0
+                if self.running is not None:
+                    elapsed = time.perf_counter() - self.running_start_time
+                    eta = max(self.estimate(self.running) - elapsed, 0.0)
+
+            for task in self.ordered_tasks():
+                if eta is not None:
+                    eta += self.estimate(task)
+                pending.append(dict(task_id=getattr(task, 'task_id', None), priority=self.get_priority(task),
+                                    steps=self.get_steps(task), eta=eta))
+
+            return dict(
+                pending=len(self.tasks),
+                pending_interactive=sum(1 for x in pending if x['priority'] == PRIORITY_INTERACTIVE),
+                pending_bulk=sum(1 for x in pending if x['priority'] == PRIORITY_BULK),
+                running=getattr(self.running, 'task_id', None),
+                completed=self.completed,
+                cancelled=self.cancelled,
+                model_swaps=self.model_swaps,
+                seconds_per_step=self.seconds_per_step,
+                seconds_per_task=self.seconds_per_task,
+                eta=eta,
+                tasks=pending
+            )
@@ -1,20 +1,25 @@
+import copy
+import os
 from collections import OrderedDict
 
 import modules.core as core
+import modules.image_cache
 import torch
+import args_manager
+import ldm_patched.modules.utils
+from ldm_patched.modules import model_management
 from ldm_patched.contrib.external_upscale_model import ImageUpscaleWithModel
 from ldm_patched.pfn.architecture.RRDB import RRDBNet as ESRGAN
 from modules.config import downloading_upscale_model
 
 opImageUpscaleWithModel = ImageUpscaleWithModel()
 model = None
+cpu_models = {}
 
 
-def perform_upscale(img):
+def load_upscale_model():
     global model
 
-    print(f'Upscaling image with shape {str(img.shape)} ...')
-
     if model is None:
         model_filename = downloading_upscale_model()
         sd = torch.load(model_filename, weights_only=True)
@@ -26,8 +31,71 @@ def perform_upscale(img):
         model.cpu()
         model.eval()
 
-    img = core.numpy_to_pytorch(img)
-    img = opImageUpscaleWithModel.upscale(model, img)[0]
-    img = core.pytorch_to_numpy(img)[0]
+    return model
+
+
+def perform_upscale(img):
+    print(f'Upscaling image with shape {str(img.shape)} ...')
+
+    on_cpu = model_management.get_torch_device().type == 'cpu'
+    signature = ['upscale', os.path.basename(downloading_upscale_model()), on_cpu and args_manager.args.upscale_cpu_bf16]
+    key = modules.image_cache.get_key(signature, img)
+    result = modules.image_cache.load(key)
+    if result is not None:
+        print('Upscaled image reused from cache.')
+        return result
+
+    load_upscale_model()
 
+    if on_cpu:
+        img = upscale_on_cpu(img)
+    else:
+        img = core.numpy_to_pytorch(img)
+        img = opImageUpscaleWithModel.upscale(model, img)[0]
+        img = core.pytorch_to_numpy(img)[0]
+
+    modules.image_cache.save(key, img)
     return img
+
+
+@torch.inference_mode()
+def upscale_on_cpu(img, workers=None, bfloat16=None, channels_last=None):
+    """
+    Upscale on CPU with the tiles split across worker threads, each limited to its share of the intra-op threads.
+    The defaults are taken from the --upscale-cpu-* arguments.
+    """
+    workers = max(args_manager.args.upscale_cpu_workers if workers is None else workers, 1)
+    bfloat16 = args_manager.args.upscale_cpu_bf16 if bfloat16 is None else bfloat16
+    channels_last = args_manager.args.upscale_cpu_channels_last if channels_last is None else channels_last
+
+    dtype = torch.bfloat16 if bfloat16 else torch.float32
+    memory_format = torch.channels_last if channels_last else torch.contiguous_format
+
+    upscale_model = load_upscale_model()
+    if dtype != torch.float32 or memory_format != torch.contiguous_format:
+        # converted copies, so that the float32 weights are never rounded
+        converted_model = cpu_models.get((dtype, memory_format))
+        if converted_model is None:
+            converted_model = copy.deepcopy(upscale_model).to(dtype=dtype, memory_format=memory_format)
+            cpu_models[(dtype, memory_format)] = converted_model
+        upscale_model = converted_model
+
+    def upscale(x):
+        return upscale_model(x.to(dtype=dtype, memory_format=memory_format)).float()
+
+    in_img = core.numpy_to_pytorch(img).movedim(-1, -3)
+    tile = 512
+    overlap = 32
+    steps = in_img.shape[0] * ldm_patched.modules.utils.get_tiled_scale_steps(in_img.shape[3], in_img.shape[2], tile_x=tile, tile_y=tile, overlap=overlap)
+    pbar = ldm_patched.modules.utils.ProgressBar(steps)
+
+    num_threads = torch.get_num_threads()
+    torch.set_num_threads(max(num_threads // workers, 1))
+    try:
+        s = ldm_patched.modules.utils.tiled_scale(in_img, upscale, tile_x=tile, tile_y=tile, overlap=overlap,
+                                                  upscale_amount=upscale_model.scale, pbar=pbar, workers=workers)
+    finally:
+        torch.set_num_threads(num_threads)
+
+    s = torch.clamp(s.movedim(-3, -1), min=0, max=1.0)
+    return core.pytorch_to_numpy(s)[0]
@@ -5,12 +5,15 @@ import datetime
 import random
 import math
 import os
+import sys
+import threading
 import cv2
 import re
 from typing import List, Tuple, AnyStr, NamedTuple
 
 import json
 import hashlib
+import mmap
 
 from PIL import Image
 
@@ -25,8 +28,18 @@ LANCZOS = (Image.Resampling.LANCZOS if hasattr(Image, 'Resampling') else Image.L
 # <lora:aNotherLora:-1.6>
 LORAS_PROMPT_PATTERN = re.compile(r"(<lora:([^:]+):([+-]?(?:\d+(?:\.\d*)?|\.\d+))>)", re.X)
 
+# Matches wildcard placeholders like __color__
+WILDCARDS_PATTERN = re.compile(r'__([\w-]+)__')
+
 HASH_SHA256_LENGTH = 10
 
+# wildcard name -> file, rebuilt when modules.config.wildcard_filenames is replaced
+wildcard_index = {}
+wildcard_index_source = None
+# wildcard file -> ((mtime_ns, size), words)
+wildcard_words = {}
+wildcard_lock = threading.Lock()
+
 
 def erode_or_dilate(x, k):
     k = int(k)
@@ -203,12 +216,27 @@ def addnet_hash_safetensors(b):
 
 
 def calculate_sha256(filename) -> str:
+    # .safetensors files are hashed in full too, addnet_hash_safetensors skips the header and gives a different
+    # value than the sha256 stored in image metadata and hash_cache.txt and looked up on Civitai
     hash_sha256 = hashlib.sha256()
-    blksize = 1024 * 1024
+    blksize = 16 * 1024 * 1024
 
     with open(filename, "rb") as f:
-        for chunk in iter(lambda: f.read(blksize), b""):
-            hash_sha256.update(chunk)
+        size = os.fstat(f.fileno()).st_size
+        if size == 0:
+            return hash_sha256.hexdigest()
+
+        # memory-mapped reads avoid copying every block, hashlib releases the GIL for large blocks
+        try:
+            with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as m:
+                with memoryview(m) as view:
+                    for offset in range(0, size, blksize):
+                        hash_sha256.update(view[offset:offset + blksize])
+        except (OSError, ValueError):
+            hash_sha256 = hashlib.sha256()
+            f.seek(0)
+            for chunk in iter(lambda: f.read(blksize), b""):
+                hash_sha256.update(chunk)
 
     return hash_sha256.hexdigest()
 
@@ -465,18 +493,45 @@ def cleanup_prompt(prompt):
     return cleaned_prompt[:-2]
 
 
-def apply_wildcards(wildcard_text, rng, i, read_wildcards_in_order) -> str:
+def get_wildcard_words(placeholder) -> tuple:
+    """
+    Non-empty lines of the wildcard file, read once and kept until the file changes.
+    Raises KeyError if there is no such wildcard file.
+    """
+    global wildcard_index, wildcard_index_source
+
+    with wildcard_lock:
+        if wildcard_index_source is not modules.config.wildcard_filenames:
+            wildcard_index = {}
+            for filename in modules.config.wildcard_filenames:
+                wildcard_index.setdefault(os.path.splitext(os.path.basename(filename))[0], filename)
+            wildcard_index_source = modules.config.wildcard_filenames
+
+        path = os.path.join(modules.config.path_wildcards, wildcard_index[placeholder])
+        stat = os.stat(path)
+        signature = (stat.st_mtime_ns, stat.st_size)
+
+        entry = wildcard_words.get(path)
+        if entry is not None and entry[0] == signature:
+            return entry[1]
+
+        with open(path, encoding='utf-8') as fp:
+            words = tuple(sys.intern(x) for x in fp.read().splitlines() if x != '')
+        wildcard_words[path] = (signature, words)
+        return words
+
+
+def apply_wildcards(wildcard_text, rng, i, read_wildcards_in_order, verbose=True) -> str:
     for _ in range(modules.config.wildcards_max_bfs_depth):
-        placeholders = re.findall(r'__([\w-]+)__', wildcard_text)
+        placeholders = WILDCARDS_PATTERN.findall(wildcard_text)
         if len(placeholders) == 0:
             return wildcard_text
 
-        print(f'[Wildcards] processing: {wildcard_text}')
+        if verbose:
+            print(f'[Wildcards] processing: {wildcard_text}')
         for placeholder in placeholders:
             try:
-                matches = [x for x in modules.config.wildcard_filenames if os.path.splitext(os.path.basename(x))[0] == placeholder]
-                words = open(os.path.join(modules.config.path_wildcards, matches[0]), encoding='utf-8').read().splitlines()
-                words = [x for x in words if x != '']
+                words = get_wildcard_words(placeholder)
                 assert len(words) > 0
                 if read_wildcards_in_order:
                     wildcard_text = wildcard_text.replace(f'__{placeholder}__', words[i % len(words)], 1)
@@ -486,7 +541,8 @@ def apply_wildcards(wildcard_text, rng, i, read_wildcards_in_order) -> str:
                 print(f'[Wildcards] Warning: {placeholder}.txt missing or empty. '
                       f'Using "{placeholder}" as a normal word.')
                 wildcard_text = wildcard_text.replace(f'__{placeholder}__', placeholder)
-            print(f'[Wildcards] {wildcard_text}')
+            if verbose:
+                print(f'[Wildcards] {wildcard_text}')
 
     print(f'[Wildcards] BFS stack overflow. Current text: {wildcard_text}')
     return wildcard_text
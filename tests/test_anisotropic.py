@@ -0,0 +1,17 @@
+import unittest
+
+import torch
+
+from modules.anisotropic import adaptive_anisotropic_filter
+
+
+class TestAnisotropic(unittest.TestCase):
+    def test_chunked_filter_matches_unfold(self):
+        generator = torch.Generator().manual_seed(0)
+        x = torch.randn(2, 4, 24, 20, generator=generator)
+        g = torch.randn(2, 4, 24, 20, generator=generator)
+        expected = adaptive_anisotropic_filter(x, g, rows_per_chunk=13)
+
+        for rows_per_chunk in [1, 4, 12]:
+            result = adaptive_anisotropic_filter(x, g, rows_per_chunk=rows_per_chunk)
+            torch.testing.assert_close(result, expected, rtol=1e-5, atol=1e-5)
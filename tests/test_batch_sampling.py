@@ -0,0 +1,29 @@
+import unittest
+
+import torch
+
+import ldm_patched.k_diffusion.sampling as sampling
+import modules.flags as flags
+
+
+def denoise(x, sigma, **kwargs):
+    # stands in for the UNet, every row only depends on itself
+    return x / (1.0 + sigma[:, None, None, None] ** 2)
+
+
+class TestBatchSampling(unittest.TestCase):
+    def test_batched_row_matches_single_run(self):
+        sigmas = sampling.get_sigmas_karras(10, 0.03, 14.6)
+        seeds = [1, 2]
+        x = torch.cat([torch.randn(1, 4, 8, 8, generator=torch.Generator().manual_seed(s)) for s in seeds]) * sigmas[0]
+
+        for name in ['euler', 'dpmpp_2m', 'dpmpp_sde_gpu', 'dpmpp_2m_sde_gpu', 'dpmpp_3m_sde_gpu']:
+            self.assertIn(name, flags.BATCH_SEED_SAMPLERS)
+            sampler = getattr(sampling, f'sample_{name}')
+            batched = sampler(denoise, x, sigmas, extra_args={'seed': seeds}, disable=True)
+            single = sampler(denoise, x[1:], sigmas, extra_args={'seed': seeds[1]}, disable=True)
+            torch.testing.assert_close(batched[1:], single, msg=f'{name}: batched row differs from the single run')
+
+    def test_ancestral_samplers_are_sampled_alone(self):
+        for name in ['euler_ancestral', 'dpm_2_ancestral', 'dpmpp_2s_ancestral', 'ddpm', 'lcm', 'tcd', 'restart']:
+            self.assertNotIn(name, flags.BATCH_SEED_SAMPLERS)
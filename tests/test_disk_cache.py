@@ -0,0 +1,44 @@
+import os
+import tempfile
+import time
+import unittest
+
+from modules.disk_cache import DiskCache
+
+
+def write(data):
+    def save_function(path):
+        with open(path, 'wb') as fp:
+            fp.write(data)
+    return save_function
+
+
+def read(path):
+    with open(path, 'rb') as fp:
+        return fp.read()
+
+
+class TestDiskCache(unittest.TestCase):
+    def test_evicts_least_recently_used_file(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiskCache(directory, max_bytes=250, extension='.bin')
+            cache.save('aa', write(b'a' * 100))
+            cache.save('bb', write(b'b' * 100))
+            os.utime(cache.get_path('aa'), (time.time() - 20, time.time() - 20))
+            os.utime(cache.get_path('bb'), (time.time() - 10, time.time() - 10))
+            cache.index = None
+
+            self.assertEqual(cache.load('aa', read), b'a' * 100)
+            cache.save('cc', write(b'c' * 100))
+
+            self.assertEqual(cache.load('aa', read), b'a' * 100)
+            self.assertIsNone(cache.load('bb', read))
+            self.assertEqual(cache.load('cc', read), b'c' * 100)
+
+    def test_disabled(self):
+        with tempfile.TemporaryDirectory() as directory:
+            cache = DiskCache(directory, max_bytes=0, extension='.bin')
+            cache.save('aa', write(b'a'))
+
+            self.assertIsNone(cache.load('aa', read))
+            self.assertEqual(os.listdir(directory), [])
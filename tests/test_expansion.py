@@ -0,0 +1,43 @@
+import os
+import types
+import unittest
+
+import torch
+from transformers import AutoTokenizer, GPT2Config, GPT2LMHeadModel
+
+from extras.expansion import FooocusExpansion, safe_str, neg_inf
+from modules.config import path_fooocus_expansion
+
+
+def create_expansion():
+    # a small randomly initialised GPT2 with the real tokenizer and vocab, so no model download is needed
+    expansion = FooocusExpansion.__new__(FooocusExpansion)
+    expansion.tokenizer = AutoTokenizer.from_pretrained(path_fooocus_expansion)
+
+    with open(os.path.join(path_fooocus_expansion, 'positive.txt'), encoding='utf-8') as f:
+        positive_words = f.read().splitlines()
+    positive_words = set('Ġ' + x.lower() for x in positive_words if x != '')
+    expansion.logits_bias = torch.zeros((1, len(expansion.tokenizer.vocab)), dtype=torch.float32) + neg_inf
+    for k, v in expansion.tokenizer.vocab.items():
+        if k in positive_words:
+            expansion.logits_bias[0, v] = 0
+
+    torch.manual_seed(0)
+    config = GPT2Config.from_pretrained(path_fooocus_expansion, n_layer=2)
+    expansion.model = GPT2LMHeadModel(config).eval()
+    expansion.patcher = types.SimpleNamespace(load_device=torch.device('cpu'))
+    return expansion
+
+
+class TestExpansion(unittest.TestCase):
+    def test_batched_rows_match_single_calls(self):
+        expansion = create_expansion()
+        prompts = [safe_str(x) + ',' for x in ['a handsome man', 'a cat sitting on a wooden table in the sun',
+                                                'a handsome man', 'forest']]
+        seeds = [0, 1, 2, 12345]
+
+        singles = [expansion.generate(prompt, seed) for prompt, seed in zip(prompts, seeds)]
+        batched = expansion.generate_batch(prompts, seeds)
+
+        self.assertEqual(batched, singles)
+        self.assertNotEqual(singles[0], singles[2])
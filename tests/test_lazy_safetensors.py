@@ -0,0 +1,59 @@
+import os
+import tempfile
+import unittest
+
+import safetensors.torch
+import torch
+
+from ldm_patched.modules.utils import LazySafetensorsDict, load_state_dict, load_torch_file
+
+
+class TestLazySafetensorsDict(unittest.TestCase):
+    def setUp(self):
+        self.model = torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.Linear(3, 2))
+        self.directory = tempfile.TemporaryDirectory()
+        self.filename = os.path.join(self.directory.name, 'model.safetensors')
+        sd = {f'model.{k}': v for k, v in self.model.state_dict().items()}
+        sd['vae.weight'] = torch.ones(5)
+        safetensors.torch.save_file(sd, self.filename)
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_reads_each_tensor_once(self):
+        sd = load_torch_file(self.filename, lazy=True)
+
+        self.assertIsInstance(sd, LazySafetensorsDict)
+        self.assertEqual(sd.nelement('model.0.weight'), 12)
+        self.assertEqual(len(sd.values), 0)
+        self.assertIs(sd['model.0.weight'], sd['model.0.weight'])
+        self.assertEqual(len(sd.values), 1)
+
+    def test_load_state_dict_matches_torch(self):
+        sd = load_torch_file(self.filename, lazy=True)
+        to_load = sd.pop_prefix('model.')
+
+        self.assertEqual(len(to_load.values), 0)
+        self.assertEqual(list(sd.keys()), ['vae.weight'])
+
+        model = torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.Linear(3, 2))
+        missing, unexpected = load_state_dict(model, to_load)
+
+        self.assertEqual((missing, unexpected), ([], []))
+        self.assertEqual(len(to_load), 0)
+        for k, v in self.model.state_dict().items():
+            self.assertTrue(torch.equal(model.state_dict()[k], v))
+
+    def test_load_state_dict_reports_missing_and_unexpected_keys(self):
+        sd = load_torch_file(self.filename, lazy=True)
+        del sd['model.1.bias']
+
+        model = torch.nn.Sequential(torch.nn.Linear(4, 3), torch.nn.Linear(3, 2))
+        missing, unexpected = load_state_dict(model, sd.pop_prefix('model.'))
+
+        self.assertEqual(missing, ['1.bias'])
+        self.assertEqual(unexpected, [])
+
+
+if __name__ == '__main__':
+    unittest.main()
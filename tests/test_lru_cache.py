@@ -0,0 +1,64 @@
+import unittest
+
+import numpy as np
+
+from modules.lru_cache import LRUCache, sizeof
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used_item(self):
+        cache = LRUCache(max_items=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+        cache.put('c', 3)
+
+        self.assertIn('a', cache)
+        self.assertNotIn('b', cache)
+        self.assertIn('c', cache)
+
+    def test_byte_budget(self):
+        cache = LRUCache(max_bytes=250)
+        for i in range(4):
+            cache.put(i, np.zeros(100, dtype=np.uint8))
+
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.total_bytes, 200)
+        self.assertFalse(cache.put('too_large', np.zeros(300, dtype=np.uint8)))
+        self.assertNotIn('too_large', cache)
+
+    def test_replace_updates_size(self):
+        cache = LRUCache(max_bytes=1000)
+        cache.put('a', 'x' * 10)
+        cache.put('a', 'x' * 20)
+
+        self.assertEqual(cache.total_bytes, 20)
+        self.assertEqual(cache.pop('a'), 'x' * 20)
+        self.assertEqual(cache.total_bytes, 0)
+
+    def test_items_in_lru_order(self):
+        cache = LRUCache()
+        cache.put('a', 1)
+        cache.put('b', 2)
+        cache.get('a')
+
+        self.assertEqual(cache.items(), [('b', 2), ('a', 1)])
+
+    def test_stats(self):
+        cache = LRUCache()
+        cache.put('a', 1)
+        cache.get('a')
+        cache.get('b')
+
+        self.assertEqual(cache.stats()['hits'], 1)
+        self.assertEqual(cache.stats()['misses'], 1)
+
+    def test_sizeof(self):
+        test_cases = [
+            {'value': np.zeros((2, 3), dtype=np.float32), 'output': 24},
+            {'value': ('abc', np.zeros(4, dtype=np.uint8)), 'output': 7},
+            {'value': {'a': np.zeros(2, dtype=np.int64)}, 'output': 16},
+        ]
+
+        for test in test_cases:
+            self.assertEqual(test['output'], sizeof(test['value']))
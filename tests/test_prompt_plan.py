@@ -0,0 +1,21 @@
+import unittest
+
+from modules.prompt_plan import plan_prompts, get_unique_workloads
+from modules.sdxl_styles import apply_arrays, apply_arrays_many
+
+
+class TestPromptPlan(unittest.TestCase):
+    def test_apply_arrays_many(self):
+        texts = ['a [[red,green]] [[cat,dog,owl]]'] * 7 + ['plain']
+
+        self.assertEqual(apply_arrays_many(texts, range(8)),
+                         [apply_arrays(text, i) for i, text in enumerate(texts)])
+
+    def test_plan_deduplicates_colliding_arrays(self):
+        tasks = plan_prompts(['a [[red,red,blue]] car'] * 3, 'ugly', [], [], [], seed=5,
+                             disable_seed_increment=False, use_style=False, read_wildcards_in_order=False)
+
+        self.assertEqual([t['task_seed'] for t in tasks], [5, 6, 7])
+        self.assertEqual([t['task_prompt'] for t in tasks], ['a red car', 'a red car', 'a blue car'])
+        self.assertEqual(list(get_unique_workloads(tasks, 'positive').values()), [[0, 1], [2]])
+        self.assertEqual(list(get_unique_workloads(tasks, 'negative').values()), [[0, 1, 2]])
@@ -0,0 +1,141 @@
+import copy
+import threading
+import unittest
+
+from modules.task_queue import TaskScheduler, YieldChannel, PRIORITY_INTERACTIVE, PRIORITY_BULK
+
+
+class TestYieldChannel(unittest.TestCase):
+    def test_coalesces_pending_previews(self):
+        channel = YieldChannel()
+        channel.append(['preview', (1, 'a', None)])
+        channel.append(['preview', (2, 'b', None)])
+        channel.append(['results', []])
+        channel.append(['preview', (3, 'c', None)])
+
+        self.assertEqual(len(channel), 3)
+        self.assertEqual(channel.get(), ['preview', (2, 'b', None)])
+        self.assertEqual(channel.get()[0], 'results')
+        self.assertEqual(channel.get(), ['preview', (3, 'c', None)])
+        self.assertEqual(channel.coalesced, 1)
+
+    def test_get_blocks_until_append(self):
+        channel = YieldChannel()
+        threading.Timer(0.05, channel.append, args=[['finish', []]]).start()
+
+        self.assertEqual(channel.get(timeout=5), ['finish', []])
+        self.assertIsNone(channel.get(timeout=0.01))
+
+    def test_deepcopy(self):
+        channel = YieldChannel()
+        channel.append(['results', [1]])
+        channel_copy = copy.deepcopy(channel)
+
+        self.assertEqual(channel_copy.get(), ['results', [1]])
+        self.assertEqual(len(channel), 1)
+
+    def test_is_observed(self):
+        channel = YieldChannel()
+        self.assertFalse(channel.is_observed())
+
+        channel.append(['preview', (1, 'a', None)])
+        channel.get()
+        self.assertTrue(channel.is_observed())
+        self.assertFalse(channel.is_observed(timeout=0))
+
+
+class Task:
+    def __init__(self, task_id, priority=PRIORITY_INTERACTIVE, steps=30, image_number=1, base_model_name='a',
+                 prompt_loras=None):
+        self.task_id = task_id
+        self.base_model_name = base_model_name
+        self.priority = priority
+        self.steps = steps
+        self.image_number = image_number
+        self.prompt_loras = prompt_loras or []
+
+    def get_prompt_loras(self):
+        return self.prompt_loras
+
+
+class TestTaskScheduler(unittest.TestCase):
+    def test_fifo(self):
+        queue = TaskScheduler()
+        queue.append(Task('a'))
+        queue.append(Task('b'))
+
+        self.assertEqual(queue.get().task_id, 'a')
+        self.assertEqual(queue.get().task_id, 'b')
+        self.assertIsNone(queue.get(timeout=0.01))
+
+    def test_interactive_before_bulk(self):
+        queue = TaskScheduler()
+        for task in [Task(1, PRIORITY_BULK), Task(2, PRIORITY_BULK), Task(3), Task(4)]:
+            queue.append(task)
+
+        self.assertEqual([queue.get().task_id for _ in range(4)], [3, 4, 1, 2])
+
+    def test_cancel(self):
+        queue = TaskScheduler()
+        queue.append(Task(1))
+        queue.append(Task(2))
+
+        self.assertEqual(queue.cancel(1).task_id, 1)
+        self.assertIsNone(queue.cancel(1))
+        self.assertEqual(queue.get().task_id, 2)
+        self.assertEqual(queue.stats()['cancelled'], 1)
+
+    def test_eta(self):
+        queue = TaskScheduler()
+        for task in [Task(1), Task(2, steps=10, image_number=2), Task(3, PRIORITY_BULK, steps=5)]:
+            queue.append(task)
+
+        self.assertIsNone(queue.stats()['eta'])
+
+        task = queue.get()
+        queue.running_sampled_steps = 29
+        queue.running_sampling_seconds = 2.9
+        queue.running_start_time -= 4.0
+        queue.task_done(task)
+        stats = queue.stats()
+
+        self.assertAlmostEqual(stats['seconds_per_step'], 0.1, places=2)
+        self.assertAlmostEqual(stats['seconds_per_task'], 1.0, places=1)
+        self.assertEqual(stats['pending'], 2)
+        self.assertEqual(stats['pending_bulk'], 1)
+        self.assertAlmostEqual(stats['tasks'][0]['eta'], 3.0, places=1)
+        self.assertAlmostEqual(stats['tasks'][1]['eta'], 4.5, places=1)
+
+    def test_step_time_excludes_gaps_between_sampling_runs(self):
+        queue = TaskScheduler()
+        queue.append(Task(1, steps=2, image_number=2))
+
+        task = queue.get()
+        queue.step_done(task, 0, images=2)
+        queue.running_step_time -= 0.5
+        queue.step_done(task, 1, images=2)
+        queue.running_step_time -= 10.0
+        queue.step_done(task, 0, images=2)
+
+        self.assertEqual(queue.running_sampled_steps, 2)
+        self.assertAlmostEqual(queue.running_sampling_seconds, 0.5, places=1)
+
+    def test_groups_by_model_within_fairness_bound(self):
+        queue = TaskScheduler(max_skips=2)
+        for i, model in enumerate(['a', 'b', 'a', 'b', 'a', 'a', 'a']):
+            queue.append(Task(i, base_model_name=model))
+
+        order = [queue.get().task_id for _ in range(7)]
+
+        self.assertEqual(order, [0, 2, 4, 1, 3, 5, 6])
+        self.assertEqual(queue.stats()['model_swaps'], 2)
+
+    def test_groups_by_prompt_loras(self):
+        queue = TaskScheduler(max_skips=2)
+        for i, loras in enumerate([[], [('a.safetensors', 1.0)], [], [('a.safetensors', 1.0)]]):
+            queue.append(Task(i, prompt_loras=loras))
+
+        order = [queue.get().task_id for _ in range(4)]
+
+        self.assertEqual(order, [0, 2, 1, 3])
+        self.assertEqual(queue.stats()['model_swaps'], 1)
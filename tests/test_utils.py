@@ -135,3 +135,43 @@ class TestUtils(unittest.TestCase):
             expected = test["output"]
             actual = util.parse_lora_references_from_prompt(prompt, loras, loras_limit=loras_limit, lora_filenames=lora_filenames)
             self.assertEqual(expected, actual)
+
+    def test_calculate_sha256(self):
+        import hashlib
+        import tempfile
+
+        for data in [b'', b'fooocus', os.urandom(20 * 1024 * 1024)]:
+            with tempfile.NamedTemporaryFile(delete=False) as fp:
+                fp.write(data)
+            try:
+                self.assertEqual(util.calculate_sha256(fp.name), hashlib.sha256(data).hexdigest())
+            finally:
+                os.remove(fp.name)
+
+    def test_apply_wildcards_reloads_changed_files(self):
+        import random
+        import tempfile
+
+        import modules.config
+
+        path_wildcards, wildcard_filenames = modules.config.path_wildcards, modules.config.wildcard_filenames
+        with tempfile.TemporaryDirectory() as directory:
+            with open(os.path.join(directory, 'color.txt'), 'w', encoding='utf-8') as fp:
+                fp.write('red\n\n__shade__\n')
+            with open(os.path.join(directory, 'shade.txt'), 'w', encoding='utf-8') as fp:
+                fp.write('dark\n')
+            modules.config.path_wildcards = directory
+            modules.config.wildcard_filenames = ['color.txt', 'shade.txt']
+
+            try:
+                rng = random.Random(0)
+                self.assertEqual(util.apply_wildcards('a __color__ car', rng, 0, True), 'a red car')
+                self.assertEqual(util.apply_wildcards('a __color__ car', rng, 1, True), 'a dark car')
+                self.assertEqual(util.apply_wildcards('a __missing__ car', rng, 0, True), 'a missing car')
+
+                with open(os.path.join(directory, 'color.txt'), 'w', encoding='utf-8') as fp:
+                    fp.write('blue\n')
+                os.utime(os.path.join(directory, 'color.txt'), ns=(0, 0))
+                self.assertEqual(util.apply_wildcards('a __color__ car', rng, 0, True), 'a blue car')
+            finally:
+                modules.config.path_wildcards, modules.config.wildcard_filenames = path_wildcards, wildcard_filenames
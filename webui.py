@@ -43,50 +43,51 @@ def generate_clicked(task: worker.AsyncTask):
     execution_start_time = time.perf_counter()
     finished = False
 
-    yield gr.update(visible=True, value=modules.html.make_progress_html(1, 'Waiting for task to start ...')), \
+    worker.async_tasks.append(task)
+
+    waiting_text = 'Waiting for task to start ...'
+    queue_stats = worker.async_tasks.stats()
+    for index, pending_task in enumerate(queue_stats['tasks']):
+        if pending_task['task_id'] == task.task_id and (index > 0 or queue_stats['running'] is not None):
+            waiting_text = f'Waiting for task to start, {index + (queue_stats["running"] is not None)} ahead'
+            if pending_task['eta'] is not None:
+                waiting_text += f', finished in about {pending_task["eta"]:.0f} seconds'
+            waiting_text += ' ...'
+
+    yield gr.update(visible=True, value=modules.html.make_progress_html(1, waiting_text)), \
         gr.update(visible=True, value=None), \
         gr.update(visible=False, value=None), \
         gr.update(visible=False)
 
-    worker.async_tasks.append(task)
-
     while not finished:
-        time.sleep(0.01)
-        if len(task.yields) > 0:
-            flag, product = task.yields.pop(0)
-            if flag == 'preview':
-
-                # help bad internet connection by skipping duplicated preview
-                if len(task.yields) > 0:  # if we have the next item
-                    if task.yields[0][0] == 'preview':   # if the next item is also a preview
-                        # print('Skipped one preview for better internet connection.')
-                        continue
-
-                percentage, title, image = product
-                yield gr.update(visible=True, value=modules.html.make_progress_html(percentage, title)), \
-                    gr.update(visible=True, value=image) if image is not None else gr.update(), \
-                    gr.update(), \
-                    gr.update(visible=False)
-            if flag == 'results':
-                yield gr.update(visible=True), \
-                    gr.update(visible=True), \
-                    gr.update(visible=True, value=product), \
-                    gr.update(visible=False)
-            if flag == 'finish':
-                if not args_manager.args.disable_enhance_output_sorting:
-                    product = sort_enhance_images(product, task)
-
-                yield gr.update(visible=False), \
-                    gr.update(visible=False), \
-                    gr.update(visible=False), \
-                    gr.update(visible=True, value=product)
-                finished = True
-
-                # delete Fooocus temp images, only keep gradio temp images
-                if args_manager.args.disable_image_log:
-                    for filepath in product:
-                        if isinstance(filepath, str) and os.path.exists(filepath):
-                            os.remove(filepath)
+        # blocks until the worker yields, duplicated previews are coalesced to help bad internet connection
+        flag, product = task.yields.get()
+        if flag == 'preview':
+            percentage, title, image = product
+            yield gr.update(visible=True, value=modules.html.make_progress_html(percentage, title)), \
+                gr.update(visible=True, value=image) if image is not None else gr.update(), \
+                gr.update(), \
+                gr.update(visible=False)
+        if flag == 'results':
+            yield gr.update(visible=True), \
+                gr.update(visible=True), \
+                gr.update(visible=True, value=product), \
+                gr.update(visible=False)
+        if flag == 'finish':
+            if not args_manager.args.disable_enhance_output_sorting:
+                product = sort_enhance_images(product, task)
+
+            yield gr.update(visible=False), \
+                gr.update(visible=False), \
+                gr.update(visible=False), \
+                gr.update(visible=True, value=product)
+            finished = True
+
+            # delete Fooocus temp images, only keep gradio temp images
+            if args_manager.args.disable_image_log:
+                for filepath in product:
+                    if isinstance(filepath, str) and os.path.exists(filepath):
+                        os.remove(filepath)
 
     execution_time = time.perf_counter() - execution_start_time
     print(f'Total time: {execution_time:.2f} seconds')
@@ -188,6 +189,8 @@ with shared.gradio_root:
                         currentTask.last_stop = 'stop'
                         if (currentTask.processing):
                             model_management.interrupt_current_processing()
+                        else:
+                            worker.cancel_task(currentTask.task_id)
                         return currentTask
 
                     def skip_clicked(currentTask):